@@ -1,33 +1,488 @@
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import contextlib
+import glob
+import importlib
 import os
 import sys
 import json # Ensure json is imported
+import time
+
+_IMPORTS_STARTED = time.perf_counter()
 
 # Add the 'scripts' directory to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'scripts'))
 
-from extract_images import extract_images
-from extract_messages_regex import extract_message_text_from_har
-from organize_assets import organize_and_copy_assets
-from generate_company_profile import generate_company_profile
+# Only the light modules every run needs are imported here. Extractors,
+# organize_assets (Pillow), search_index and generate_company_profile (Gemini)
+# are imported by the stage that uses them, see import_stage_module.
+from har_classify import EntryClassifier
+from har_pipeline import create_handlers, run_pipeline
+from har_stream import (HAR_SUFFIXES, ZIP_MEMBER_SEPARATOR, ZIP_SUFFIXES, HarFormatError, list_zip_members,
+                        scanned_bytes, split_zip_member)
+from message_writer import MESSAGES_FILENAME, MessageWriter, export_history, export_posts
+from run_report import RunReport
+from state_store import STATE_DB_FILENAME, EntryStateStore
 
-def run_all_scripts():
-    print("--- Running all data processing scripts ---")
+# Time spent importing the modules above, reported as startup_import_seconds
+STARTUP_IMPORT_SECONDS = round(time.perf_counter() - _IMPORTS_STARTED, 4)
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_HAR_PATH = os.path.join(PROJECT_ROOT, "sources", "www.facebook.com.har")
+DEFAULT_ASSETS_DIR = os.path.join(PROJECT_ROOT, "assets")
+DEFAULT_OUT_DIR = os.path.join(PROJECT_ROOT, "out")
+
+# Stages --stages can select; they always run in this order
+STAGES = ("extract-images", "extract-messages", "organize", "profile")
+# Extraction stage -> (name of its HAR entry handler, module that registers it)
+EXTRACTORS = {
+    "extract-images": ("images", "extract_images"),
+    "extract-messages": ("messages", "extract_messages_regex"),
+}
+
+# Stages recorded in out/run_report.json; "extract" is the fused pass, the
+# extract_images/extract_messages pair replaces it with --separate-passes
+PROFILED_STAGES = ("extract", "extract_images", "extract_messages", "write_outputs", "organize", "search_index",
+                   "profile")
+
+def import_stage_module(counters, module_name):
+    """
+    Imports a module for the stage that is running, so runs that skip the
+    stage never load it or its dependencies. The time taken (the stage's cold
+    start) is added to counters["import_seconds"]; a module imported before
+    costs nothing.
+    """
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    counters["import_seconds"] = round(counters.get("import_seconds", 0) + time.perf_counter() - started, 4)
+    return module
+
+@contextlib.contextmanager
+def counting_har_bytes(counters):
+    """
+    Stores the HAR bytes scanned inside the block in counters["har_bytes_scanned"].
+    A memory-mapped HAR is read through page faults, which bytes_read does not see.
+    """
+    before = scanned_bytes()
+    try:
+        yield
+    finally:
+        counters["har_bytes_scanned"] = scanned_bytes() - before
 
-    # Define paths relative to the root directory
-    project_root = os.path.dirname(os.path.abspath(__file__)) # Get the directory of the current script
+def load_json_list(json_file_path):
+    """Returns the JSON array stored in a previous run's output file, or [] if there is none."""
+    try:
+        with open(json_file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (IOError, ValueError):
+        return []
+    return data if isinstance(data, list) else []
 
-    har_file_path = os.path.join(project_root, "sources", "www.facebook.com.har")
-    assets_dir_path = os.path.join(project_root, "assets")
-    output_dir_path = os.path.join(project_root, "out")
+def extract_from_har(har_file_path, assets_dir_path, output_dir_path, fused=True, image_workers=0,
+                     dedup_images=True, incremental=False, report=None, use_index=False, normalize_messages=False,
+                     stages=STAGES):
+    """
+    Steps 1-2: extracts images into assets_dir_path and messages into
+    output_dir_path, as far as `stages` includes extract-images and
+    extract-messages. Returns a summary dict.
+    Each step is measured as a stage of `report` (a RunReport).
+    With use_index, the HAR's sidecar entry index is used, or written.
+    Raises HarFormatError if the fused pass cannot parse the HAR.
+
+    Messages are streamed into messages.jsonl as they are found, without
+    repeats (see message_writer), and then exported to history.json and
+    posts.json. normalize_messages stores NFKC-normalized, whitespace-collapsed
+    text. Incremental runs need both extraction stages: entries are recorded
+    as processed for all extractors at once.
+    """
+    if report is None:
+        report = RunReport(output_dir_path)
     history_json_file_path = os.path.join(output_dir_path, "history.json")
+    posts_json_file_path = os.path.join(output_dir_path, "posts.json")
+    messages_jsonl_path = os.path.join(output_dir_path, MESSAGES_FILENAME)
+    summary = {"har": har_file_path, "assets_dir": assets_dir_path, "out_dir": output_dir_path}
+    extract_stages = [stage for stage in STAGES if stage in EXTRACTORS and stage in stages]
+
+    state_store = None
+    if incremental:
+        state_store = EntryStateStore(os.path.join(output_dir_path, STATE_DB_FILENAME))
+        print(f"Incremental mode: using state store {state_store.db_path} ({state_store.counts()['entries']} entries already processed)")
+        fused = True
+
+    writer = None
+    if "extract-messages" in extract_stages:
+        # Incremental runs add to the messages of earlier runs, incremental or not
+        append = state_store is not None and (os.path.exists(messages_jsonl_path)
+                                              or os.path.exists(posts_json_file_path))
+        writer = MessageWriter(messages_jsonl_path, append=append, normalize=normalize_messages)
+        if append and not writer.existing:
+            # Outputs of a run from before messages.jsonl existed
+            writer.seed(load_json_list(posts_json_file_path))
+    try:
+        summary.update(_extract_into(writer, har_file_path, assets_dir_path, output_dir_path, fused, image_workers,
+                                     dedup_images, state_store, report, use_index, extract_stages))
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    if writer is None:
+        if state_store is not None:
+            state_store.close()
+        return summary
+    writer.close()
+    summary["new_messages"] = writer.written
+    print(f"Found {writer.written} new message records ({writer.duplicates} repeats dropped).")
+
+    with report.stage("write_outputs") as counters:
+        summary["messages"] = write_message_outputs(messages_jsonl_path, history_json_file_path, posts_json_file_path,
+                                                    har_file_path, writer.existing + writer.written)
+        counters["messages"] = summary["messages"]
+    if state_store is not None:
+        state_store.close()
+    return summary
+
+def _extract_into(writer, har_file_path, assets_dir_path, output_dir_path, fused, image_workers, dedup_images,
+                  state_store, report, use_index, extract_stages):
+    """
+    Runs the given extraction stages, streaming messages into writer (None
+    without extract-messages). Returns the summary fields they produce.
+    """
+    summary = {}
+    if fused:
+        # 1 + 2. Extract images and messages in a single pass over the HAR
+        handler_names = [EXTRACTORS[stage][0] for stage in extract_stages]
+        print(f"\n--- Steps 1-2: Extracting {' and '.join(handler_names)} in a single pass ---")
+        classifier = EntryClassifier()
+        with report.stage("extract") as counters, counting_har_bytes(counters):
+            for stage in extract_stages:
+                # Importing an extractor module registers its handler
+                import_stage_module(counters, EXTRACTORS[stage][1])
+            handlers = create_handlers(handler_names, {
+                "assets_dir": assets_dir_path,
+                "out_dir": output_dir_path,
+                "image_workers": image_workers,
+                "dedup_images": dedup_images,
+                "state_store": state_store,
+                "message_writer": writer,
+            })
+            results = run_pipeline(har_file_path, handlers, classifier, state_store, use_index)
+            counters["entries"] = sum(classifier.entries.values())
+            counters["body_bytes"] = sum(classifier.body_bytes.values())
+            counters["skipped_entries"] = sum(classifier.skipped_entries.values())
+            counters["previously_processed"] = sum(classifier.previously_processed.values())
+            if "images" in results:
+                counters["images"] = results["images"]
+            if "messages" in results:
+                counters["messages"] = results["messages"]["found"]
+        print("\nHAR entries by class:")
+        classifier.print_summary()
+        if "images" in results:
+            summary["images"] = results["images"]
+        summary["entry_classes"] = classifier.as_dict()
+        return summary
+
+    if "extract-images" in extract_stages:
+        # 1. Extract Images
+        print("\n--- Step 1: Extracting images ---")
+        with report.stage("extract_images") as counters, counting_har_bytes(counters):
+            extract_images = import_stage_module(counters, "extract_images").extract_images
+            counters["images"] = extract_images(har_file_path, assets_dir_path, image_workers, dedup_images,
+                                                use_index)
+
+    if "extract-messages" in extract_stages:
+        # 2. Extract Messages and Clean Text Content
+        print("\n--- Step 2: Extracting messages and cleaning text content ---")
+        with report.stage("extract_messages") as counters, counting_har_bytes(counters):
+            extract_messages_regex = import_stage_module(counters, "extract_messages_regex")
+            results = extract_messages_regex.write_message_records_from_har(har_file_path, writer, use_index)
+            counters["messages"] = results["found"] if results else 0
+    return summary
+
+def write_message_outputs(messages_jsonl_path, history_json_file_path, posts_json_file_path, har_file_path,
+                          message_count):
+    """
+    Exports messages.jsonl to the history.json (texts) and posts.json (full
+    records) arrays read by the profile step. Returns the number of records.
+    """
+    if not message_count:
+        print(f"No relevant 'text' messages found in {har_file_path}", file=sys.stderr)
+        return 0
+    try:
+        count = export_history(messages_jsonl_path, history_json_file_path)
+        print(f"Extracted message texts (as JSON array) saved to {history_json_file_path}")
+        print(f"Note: Newline characters and non-standard symbols are removed from text content during extraction.")
+        export_posts(messages_jsonl_path, posts_json_file_path)
+        print(f"Message records with post ids, timestamps and media saved to {posts_json_file_path}")
+    except IOError as e:
+        print(f"Error writing message outputs to {os.path.dirname(history_json_file_path)}: {e}", file=sys.stderr)
+        return None
+    return count
+
+def organize_step(assets_dir_path, counters, images_deduplicated=False, merge_similar_images=False,
+                  phash_threshold=None):
+    """
+    Returns organize_and_copy_assets' counts, or None when the step is skipped
+    (images_deduplicated: this run extracted the images with dedup on, so there
+    are no byte-identical copies to find). Byte-identical copies are deleted; with merge_similar_images, resized or
+    re-encoded copies (perceptual hashes within phash_threshold bits, None for
+    image_similarity.DEFAULT_HAMMING_THRESHOLD) are moved to assets/.merged.
+    Pillow is only imported here, timed in counters.
+    """
+    if images_deduplicated and not merge_similar_images:
+        print("Skipped: identical images were already deduplicated during extraction (see manifest.json).")
+        return None
+    organize_assets = import_stage_module(counters, "organize_assets")
+    if not merge_similar_images:
+        return organize_assets.organize_and_copy_assets(assets_dir_path)
+    if phash_threshold is None:
+        phash_threshold = import_stage_module(counters, "image_similarity").DEFAULT_HAMMING_THRESHOLD
+    return organize_assets.organize_and_copy_assets(assets_dir_path, perceptual=True, threshold=phash_threshold)
+
+def update_search_index(index_dir_path, pages, counters):
+    """
+    Brings the (name, out_dir, assets_dir) pages up to date in the search index
+    in index_dir_path (see search_index.SEARCH_DB_FILENAME). Returns the totals.
+    """
+    search_index = import_stage_module(counters, "search_index")
+    db_path = os.path.join(index_dir_path, search_index.SEARCH_DB_FILENAME)
+    index = search_index.SearchIndex(db_path)
+    try:
+        totals = {"posts_added": 0, "asset_rows": 0}
+        for name, out_dir, assets_dir in pages:
+            for key, value in index.update_page(name, out_dir, assets_dir).items():
+                totals[key] += value
+        totals.update(index.counts())
+    finally:
+        index.close()
+    print(f"Search index {db_path}: {totals['posts_added']} posts added, {totals['posts']} posts from "
+          f"{totals['pages']} pages in total. Query it with: python scripts/search_index.py --db {db_path} query WORDS")
+    return totals
+
+def find_har_files(source):
+    """
+    Resolves a directory (every HAR inside it, compressed or not) or a glob
+    pattern to a sorted list of HAR files. A zip archive holding several HARs
+    contributes one "archive.zip!member.har" path per HAR.
+    """
+    if os.path.isdir(source):
+        paths = [path for suffix in HAR_SUFFIXES for path in glob.glob(os.path.join(source, "*" + suffix))]
+    else:
+        paths = glob.glob(source)
+    har_files = []
+    for path in sorted(set(paths)):
+        if not os.path.isfile(path):
+            continue
+        if path.lower().endswith(ZIP_SUFFIXES):
+            try:
+                members = list_zip_members(path)
+            except (OSError, ValueError) as e:
+                print(f"Warning: Skipping unreadable archive {path}: {e}", file=sys.stderr)
+                continue
+            if len(members) > 1:
+                har_files.extend(f"{path}{ZIP_MEMBER_SEPARATOR}{member}" for member in members)
+                continue
+        har_files.append(path)
+    return har_files
+
+def page_name_for(har_file_path):
+    archive, member = split_zip_member(har_file_path)
+    name = os.path.basename(member or archive)
+    for suffix in sorted(HAR_SUFFIXES, key=len, reverse=True):
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+def page_names_for(har_files):
+    """
+    Output folder names for a batch, one per HAR and all different. HARs
+    sharing a file name (captures/*/www.facebook.com.har, same-named members
+    of several archives) are prefixed with the folder or archive they are in,
+    and numbered if that still clashes.
+    """
+    names = [page_name_for(har_file_path) for har_file_path in har_files]
+    clashes = Counter(names)
+    unique_names = []
+    used = set()
+    for har_file_path, name in zip(har_files, names):
+        if clashes[name] > 1:
+            archive, member = split_zip_member(har_file_path)
+            if member is not None:
+                container = os.path.splitext(os.path.basename(archive))[0]
+            else:
+                container = os.path.basename(os.path.dirname(os.path.abspath(har_file_path)))
+            name = f"{container}_{name}"
+        unique_name = name
+        number = 2
+        while unique_name in used:
+            unique_name = f"{name}_{number}"
+            number += 1
+        used.add(unique_name)
+        unique_names.append(unique_name)
+    return unique_names
+
+def process_page(har_file_path, page_dir, dedup_images=True, phash_threshold=None, incremental=False,
+                 use_index=False, normalize_messages=False, stages=STAGES, merge_similar_images=False):
+    """
+    Batch worker: runs the extraction and organize stages of `stages` for one
+    HAR into page_dir/assets and page_dir/out, logging to page_dir/run.log.
+    Returns the page summary; errors are reported in it rather than raised.
+    """
+    assets_dir_path = os.path.join(page_dir, "assets")
+    output_dir_path = os.path.join(page_dir, "out")
+    os.makedirs(assets_dir_path, exist_ok=True)
+    os.makedirs(output_dir_path, exist_ok=True)
+
+    started = time.perf_counter()
+    report = RunReport(output_dir_path)
+    report.info.update({"har": har_file_path, "stages": list(stages)})
+    with open(os.path.join(page_dir, "run.log"), 'w', encoding='utf-8') as log_file, \
+            contextlib.redirect_stdout(log_file), contextlib.redirect_stderr(log_file):
+        try:
+            summary = {"har": har_file_path, "assets_dir": assets_dir_path, "out_dir": output_dir_path}
+            if any(stage in EXTRACTORS for stage in stages):
+                summary = extract_from_har(har_file_path, assets_dir_path, output_dir_path,
+                                           dedup_images=dedup_images, incremental=incremental, report=report,
+                                           use_index=use_index, normalize_messages=normalize_messages,
+                                           stages=stages)
+            if "organize" in stages:
+                print("\n--- Organizing assets ---")
+                with report.stage("organize") as counters:
+                    counters["assets"] = organize_step(assets_dir_path, counters,
+                                                       dedup_images and "extract-images" in stages,
+                                                       merge_similar_images, phash_threshold)
+            summary["status"] = "ok"
+        except Exception as e:
+            print(f"Error processing {har_file_path}: {e}")
+            summary = {"har": har_file_path, "status": "error", "error": str(e)}
+        report.write()
+    summary["page"] = os.path.basename(page_dir)
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    return summary
+
+def run_batch(source, batch_output_dir, jobs=None, dedup_images=True, phash_threshold=None, incremental=False,
+              use_index=False, normalize_messages=False, search=False, stages=STAGES, merge_similar_images=False):
+    """
+    Processes every HAR matched by `source` (directory or glob) on a process
+    pool of `jobs` workers. Each page gets batch_output_dir/<page>/{assets,out}
+    (see page_names_for) and a run.log, and a combined batch_summary.json is written at the top.
+    With search=True, the pages that succeeded are added to one search index,
+    batch_output_dir/search.sqlite3. Of `stages`, only extraction and organize
+    run: profile generation is not part of batch runs, and the command line
+    rejects --batch with an explicit profile stage.
+    """
+    har_files = find_har_files(source)
+    if not har_files:
+        print(f"Error: No HAR files found for '{source}'", file=sys.stderr)
+        sys.exit(1)
+
+    os.makedirs(batch_output_dir, exist_ok=True)
+    print(f"--- Batch processing {len(har_files)} HAR files into '{batch_output_dir}' ---")
+
+    started = time.perf_counter()
+    page_summaries = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(process_page, har_file_path, os.path.join(batch_output_dir, page_name),
+                            dedup_images, phash_threshold, incremental, use_index, normalize_messages,
+                            stages, merge_similar_images): har_file_path
+            for har_file_path, page_name in zip(har_files, page_names_for(har_files))
+        }
+        for future in as_completed(futures):
+            summary = future.result()
+            page_summaries.append(summary)
+            if summary["status"] == "ok":
+                print(f"Done: {summary['page']} ({summary.get('messages', 0)} messages, {summary['seconds']}s)")
+            else:
+                print(f"Failed: {summary['page']}: {summary['error']}", file=sys.stderr)
+
+    page_summaries.sort(key=lambda summary: summary["page"])
+    search_totals = None
+    if search:
+        # Written from this process only: SQLite allows one writer at a time
+        search_totals = update_search_index(
+            batch_output_dir,
+            [(summary["page"], os.path.join(batch_output_dir, summary["page"], "out"),
+              os.path.join(batch_output_dir, summary["page"], "assets"))
+             for summary in page_summaries if summary["status"] == "ok"], {})
+    report = {
+        "source": source,
+        "stages": list(stages),
+        "pages": len(page_summaries),
+        "failed": sum(1 for summary in page_summaries if summary["status"] != "ok"),
+        "messages": sum(summary.get("messages", 0) for summary in page_summaries),
+        "images_saved": sum(summary.get("images", {}).get("saved", 0) for summary in page_summaries),
+        "seconds": round(time.perf_counter() - started, 3),
+        "search_index": search_totals,
+        "page_summaries": page_summaries,
+    }
+    report_path = os.path.join(batch_output_dir, "batch_summary.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    print(f"\n--- Batch finished: {report['pages']} pages ({report['failed']} failed) in {report['seconds']}s ---")
+    print(f"Summary report saved to {report_path}")
+    return report
+
+def run_all_scripts(fused=True, image_workers=0, dedup_images=True, phash_threshold=None, incremental=False,
+                    profile_stage=None, use_index=False, normalize_messages=False, search=False, stages=STAGES,
+                    har_file_path=None, assets_dir_path=None, output_dir_path=None, merge_similar_images=False):
+    """
+    Runs the processing steps named in `stages` (see STAGES; all by default)
+    on har_file_path, writing images to assets_dir_path and everything else
+    to output_dir_path. These default to sources/www.facebook.com.har (or a
+    compressed copy of it), assets/ and out/ in the project root. Each stage
+    imports its own modules when it starts, so e.g. an extraction-only run
+    needs neither Pillow nor the Gemini libraries; the time spent importing
+    is reported per stage.
+
+    With fused=True the HAR is parsed once and each entry is handed to all
+    extraction handlers; otherwise each extractor makes its own pass as
+    before. image_workers > 0 decodes and writes images on a process pool of
+    that size. With dedup_images=True identical images are written once at
+    extraction time and the organize step has nothing left to do, unless
+    merge_similar_images asks it to merge near-duplicates (perceptual hashes
+    within phash_threshold bits, None for the default). Those are moved to
+    assets/.merged rather than deleted.
+
+    With incremental=True, a SQLite store in the output directory remembers
+    every processed entry by response hash. Entries seen in an earlier run
+    are skipped, new images continue the numbering in assets/, and new
+    messages are appended to messages.jsonl (and so to history.json and
+    posts.json). This always uses the fused pass, and needs both extraction
+    stages.
+
+    With use_index=True, a plain HAR gets a sidecar entry index
+    (<har>.index.jsonl) on the first run, and later runs read only the
+    entries the extractors want.
+
+    With search=True, the extracted posts, their hashtags and linked assets
+    are added to the full-text index out/search.sqlite3 (see search_index).
+
+    Every stage's time, peak memory, I/O and counters are written to
+    out/run_report.json; profile_stage names a stage to run under cProfile.
+    """
+    print("--- Running all data processing scripts ---")
+
+    if har_file_path is None:
+        har_file_path = DEFAULT_HAR_PATH
+        if not os.path.exists(har_file_path):
+            # A compressed capture of the same page is read as is
+            compressed = (har_file_path[:-len(".har")] + suffix for suffix in HAR_SUFFIXES)
+            har_file_path = next((path for path in compressed if os.path.exists(path)), har_file_path)
+    assets_dir_path = assets_dir_path or DEFAULT_ASSETS_DIR
+    output_dir_path = output_dir_path or DEFAULT_OUT_DIR
+    extracting = any(stage in EXTRACTORS for stage in stages)
 
     # --- File Validation ---
     print("\n--- Validating required files and directories ---")
 
-    # 1. Validate HAR file existence
-    if not os.path.exists(har_file_path):
+    # 1. Validate HAR file existence (only the extraction stages read it)
+    if not extracting:
+        print(f"Skipped: no extraction stage selected, {har_file_path} is not read")
+    elif not os.path.exists(split_zip_member(har_file_path)[0]):
         print(f"Error: Required file not found: {har_file_path}", file=sys.stderr)
-        print("Please ensure 'www.facebook.com.har' is placed in the 'sources' directory.", file=sys.stderr)
+        print("Please ensure 'www.facebook.com.har' (or .har.gz, .har.zst, .zip) is placed in the 'sources' directory, "
+              "or pass another capture with --har.", file=sys.stderr)
         sys.exit(1)
     else:
         print(f"Validated: HAR file found at {har_file_path}")
@@ -56,36 +511,120 @@ def run_all_scripts():
 
     print("--- File validation complete ---")
 
-    # 1. Extract Images
-    print("\n--- Step 1: Extracting images ---")
-    extract_images(har_file_path, assets_dir_path)
-
-    # 2. Extract Messages and Clean Text Content
-    print("\n--- Step 2: Extracting messages and cleaning text content ---")
-    extracted_texts_list = extract_message_text_from_har(har_file_path) # Renamed for clarity
-
-    if extracted_texts_list:
+    report = RunReport(output_dir_path, profile_stage)
+    report.info.update({"har": har_file_path, "assets_dir": assets_dir_path, "out_dir": output_dir_path,
+                        "stages": list(stages), "startup_import_seconds": STARTUP_IMPORT_SECONDS,
+                        "fused": fused or incremental, "image_workers": image_workers,
+                        "dedup_images": dedup_images, "incremental": incremental, "use_index": use_index,
+                        "normalize_messages": normalize_messages, "search": search})
+    if extracting:
         try:
-            with open(history_json_file_path, 'w', encoding='utf-8') as outfile:
-                # Write the entire list of strings as a single JSON array
-                json.dump(extracted_texts_list, outfile, ensure_ascii=False, indent=4) # Added indent for readability
-            print(f"Extracted message texts (as JSON array) saved to {history_json_file_path}")
-            print(f"Note: Newline characters and non-standard symbols are removed from text content during extraction.")
-
-        except IOError as e:
-            print(f"Error writing to output file {history_json_file_path}: {e}", file=sys.stderr)
-    else:
-        print(f"No relevant 'text' messages found in {har_file_path}", file=sys.stderr)
+            extract_from_har(har_file_path, assets_dir_path, output_dir_path, fused=fused,
+                             image_workers=image_workers, dedup_images=dedup_images, incremental=incremental,
+                             report=report, use_index=use_index, normalize_messages=normalize_messages,
+                             stages=stages)
+        except HarFormatError as e:
+            print(f"Error: Could not decode HAR JSON from {har_file_path}: {e}", file=sys.stderr)
+            report.write()
+            sys.exit(1)
 
     # 3. Organize Assets (remove duplicates, keep highest quality)
-    print("\n--- Step 3: Organizing assets ---")
-    organize_and_copy_assets(assets_dir_path)
+    if "organize" in stages:
+        print("\n--- Step 3: Organizing assets ---")
+        try:
+            with report.stage("organize") as counters:
+                counters["assets"] = organize_step(assets_dir_path, counters,
+                                                   dedup_images and "extract-images" in stages,
+                                                   merge_similar_images, phash_threshold)
+        except ImportError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            report.write()
+            sys.exit(1)
+
+    if search:
+        print("\n--- Updating the search index ---")
+        with report.stage("search_index") as counters:
+            counters.update(update_search_index(output_dir_path,
+                                                [(page_name_for(har_file_path), output_dir_path, assets_dir_path)],
+                                                counters))
 
     # 4. Generate Company Profile XML
-    print("\n--- Step 4: Generating company profile XML ---")
-    generate_company_profile()
+    if "profile" in stages:
+        print("\n--- Step 4: Generating company profile XML ---")
+        try:
+            with report.stage("profile") as counters:
+                generate_company_profile = import_stage_module(
+                    counters, "generate_company_profile").generate_company_profile
+                # Imported by the Gemini client anyway; loading them here counts them as cold start
+                import_stage_module(counters, "dotenv")
+                import_stage_module(counters, "google.generativeai")
+                generate_company_profile(out_dir=output_dir_path, assets_dir=assets_dir_path)
+        except ImportError as e:
+            print(f"Error: {e}. The profile stage needs: pip install python-dotenv google-generativeai",
+                  file=sys.stderr)
+            report.write()
+            sys.exit(1)
+
+    print("\n--- Stage report ---")
+    print(f"Startup imports: {STARTUP_IMPORT_SECONDS:.2f}s")
+    report.print_summary()
+    print(f"Run report saved to {report.write()}")
 
     print("\n--- All scripts finished ---")
 
 if __name__ == "__main__":
-    run_all_scripts()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Extract images and messages from a Facebook HAR capture and build a company profile.")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, metavar="STAGE",
+                        help=f"Stages to run ({', '.join(STAGES)}); they run in that order. Default: all of them (all but profile with --batch).")
+    parser.add_argument("--har",
+                        help="HAR capture to process, plain or .har.gz/.har.zst/.zip (default: sources/www.facebook.com.har).")
+    parser.add_argument("--assets-dir", help="Directory for the extracted images (default: assets/).")
+    parser.add_argument("--out-dir", help="Directory for messages, reports and the profile (default: out/).")
+    parser.add_argument("--separate-passes", action="store_true",
+                        help="Parse the HAR once per extractor instead of once for all of them.")
+    parser.add_argument("--image-workers", type=int, default=0,
+                        help="Decode and write images on this many worker processes (default: serial).")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Write every image entry and deduplicate afterwards in the organize step.")
+    parser.add_argument("--merge-similar-images", action="store_true",
+                        help="In the organize step, also merge resized/re-encoded copies of an image into the best one; they are moved to assets/.merged.")
+    parser.add_argument("--phash-threshold", type=int, default=None,
+                        help="Max perceptual-hash distance for --merge-similar-images (0-64, default: 6).")
+    parser.add_argument("--incremental", action="store_true",
+                        help=f"Skip entries processed by earlier runs (tracked in out/{STATE_DB_FILENAME}) and append new results.")
+    parser.add_argument("--index", action="store_true",
+                        help="Write a byte-offset index next to a plain HAR, and on later runs read only the entries the extractors need.")
+    parser.add_argument("--normalize-messages", action="store_true",
+                        help="Store message text NFKC-normalized with whitespace collapsed (also used for dropping repeats).")
+    parser.add_argument("--search-index", action="store_true",
+                        help="Add the extracted posts to the full-text index search.sqlite3 in the output directory (<batch-out> with --batch).")
+    parser.add_argument("--profile-stage", choices=PROFILED_STAGES,
+                        help="Run this stage under cProfile; stats go to out/profile_<stage>.prof and the run report.")
+    parser.add_argument("--batch", metavar="DIR_OR_GLOB",
+                        help="Process every HAR in a directory (or matching a glob) in parallel instead of sources/www.facebook.com.har.")
+    parser.add_argument("--batch-out", default="batch_output",
+                        help="Output root for --batch; each page gets <batch-out>/<page>/assets and /out.")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Worker processes for --batch (default: number of CPUs).")
+    args = parser.parse_args()
+    if args.batch and args.stages and "profile" in args.stages:
+        parser.error("the profile stage does not run with --batch; leave it out of --stages")
+    stages = tuple(stage for stage in STAGES if stage in (args.stages or STAGES))
+    if args.incremental and not all(stage in stages for stage in EXTRACTORS):
+        parser.error("--incremental needs both extract-images and extract-messages in --stages")
+    if args.phash_threshold is not None and not args.merge_similar_images:
+        parser.error("--phash-threshold only applies with --merge-similar-images")
+    if args.phash_threshold is not None and not 0 <= args.phash_threshold <= 64:
+        parser.error("--phash-threshold must be between 0 and 64")
+    if args.batch:
+        batch_report = run_batch(args.batch, args.batch_out, jobs=args.jobs, dedup_images=not args.no_dedup,
+                  phash_threshold=args.phash_threshold, incremental=args.incremental, use_index=args.index,
+                  normalize_messages=args.normalize_messages, search=args.search_index, stages=stages,
+                  merge_similar_images=args.merge_similar_images)
+        sys.exit(1 if batch_report["failed"] else 0)
+    run_all_scripts(fused=not args.separate_passes, image_workers=args.image_workers,
+                    dedup_images=not args.no_dedup, phash_threshold=args.phash_threshold,
+                    incremental=args.incremental, profile_stage=args.profile_stage, use_index=args.index,
+                    normalize_messages=args.normalize_messages, search=args.search_index, stages=stages,
+                    har_file_path=args.har, assets_dir_path=args.assets_dir, output_dir_path=args.out_dir,
+                    merge_similar_images=args.merge_similar_images)
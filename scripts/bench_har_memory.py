@@ -0,0 +1,79 @@
+import argparse
+import base64
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Each mode runs in a fresh interpreter so ru_maxrss only reflects that mode.
+_MODE_CODE = {
+    "json.load": (
+        "import json\n"
+        "with open(har_path, 'r', encoding='utf-8') as f:\n"
+        "    har_data = json.load(f)\n"
+        "count = sum(1 for _ in har_data['log']['entries'])\n"
+    ),
+    "iter_har_entries": (
+        "from har_stream import iter_har_entries\n"
+        "count = sum(1 for _ in iter_har_entries(har_path))\n"
+    ),
+}
+
+_RUNNER = """
+import resource, sys, time
+sys.path.insert(0, {script_dir!r})
+har_path = {har_path!r}
+started = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - started
+print(count, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+def write_sample_har(path, entry_count, body_bytes):
+    """Writes a HAR with `entry_count` base64 image entries of roughly `body_bytes` each."""
+    body = base64.b64encode(os.urandom(body_bytes)).decode('ascii')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"log": {"version": "1.2", "creator": {"name": "bench"}, "entries": [')
+        for i in range(entry_count):
+            entry = {
+                "request": {"method": "GET", "url": f"https://scontent.example/{i}.jpg"},
+                "response": {"status": 200, "content": {
+                    "size": body_bytes, "mimeType": "image/jpeg", "encoding": "base64", "text": body,
+                }},
+            }
+            if i:
+                f.write(',')
+            json.dump(entry, f)
+        f.write(']}}')
+
+def measure(mode, har_path):
+    code = _RUNNER.format(script_dir=SCRIPT_DIR, har_path=har_path, code=_MODE_CODE[mode])
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    count, elapsed, max_rss_kb = output.split()
+    return int(count), float(elapsed), int(max_rss_kb) / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare peak memory of json.load against the streaming HAR reader.")
+    parser.add_argument("--entries", type=int, default=400)
+    parser.add_argument("--body-kb", type=int, default=512, help="Decoded size of each image body in KB.")
+    parser.add_argument("--har", help="Benchmark an existing HAR file instead of generating one.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        har_path = args.har
+        if not har_path:
+            har_path = os.path.join(tmp_dir, "sample.har")
+            write_sample_har(har_path, args.entries, args.body_kb * 1024)
+
+        har_mb = os.path.getsize(har_path) / (1024 * 1024)
+        print(f"HAR file: {har_path} ({har_mb:.1f} MB)")
+        print(f"{'mode':<18}{'entries':>10}{'seconds':>10}{'peak RSS MB':>14}")
+        for mode in _MODE_CODE:
+            count, elapsed, peak_mb = measure(mode, har_path)
+            print(f"{mode:<18}{count:>10}{elapsed:>10.2f}{peak_mb:>14.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+from synthetic_har import DEFAULT_DUPLICATE_RATE, DEFAULT_IMAGE_RATIO, write_synthetic_har
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = (250, 1000, 4000)
+
+# Each stage runs in a fresh interpreter so its peak RSS only reflects that stage.
+# `count` is what the stage produced (images written, messages found, files kept).
+_STAGE_CODE = {
+    "extract_images": (
+        "from extract_images import extract_images\n"
+        "extract_images(har_path, assets_dir)\n"
+        "count = len([name for name in os.listdir(assets_dir) if name.startswith('image_')])\n"
+    ),
+    "extract_message_text_from_har": (
+        "from extract_messages_regex import extract_message_text_from_har\n"
+        "count = len(extract_message_text_from_har(har_path))\n"
+    ),
+    "organize_and_copy_assets": (
+        "from organize_assets import organize_and_copy_assets\n"
+        "organize_and_copy_assets(assets_dir)\n"
+        "count = len([name for name in os.listdir(assets_dir) if name.startswith('image_')])\n"
+    ),
+}
+
+_RESULT_PREFIX = "BENCH_RESULT "
+
+_RUNNER = """
+import json, os, resource, sys, time
+sys.path.insert(0, {script_dir!r})
+har_path = {har_path!r}
+assets_dir = {assets_dir!r}
+started = time.perf_counter()
+cpu_started = time.process_time()
+{code}
+elapsed = time.perf_counter() - started
+cpu_seconds = time.process_time() - cpu_started
+# VmHWM belongs to this process image; ru_maxrss can carry over the parent's peak across fork+exec
+peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if os.path.exists('/proc/self/status'):
+    with open('/proc/self/status') as status:
+        peak_kb = next((int(line.split()[1]) for line in status if line.startswith('VmHWM:')), peak_kb)
+print({prefix!r} + json.dumps({{"count": count, "seconds": elapsed, "cpu_seconds": cpu_seconds,
+                              "peak_rss_mb": peak_kb / 1024}}))
+"""
+
+def run_stage(stage, har_path, assets_dir):
+    """Runs one stage in a subprocess and returns its measurements, or {"error": ...} if it failed."""
+    runner = _RUNNER.format(script_dir=SCRIPT_DIR, har_path=har_path, assets_dir=assets_dir,
+                            code=_STAGE_CODE[stage], prefix=_RESULT_PREFIX)
+    result = subprocess.run([sys.executable, "-c", runner], capture_output=True, text=True)
+    for line in result.stdout.splitlines():
+        if line.startswith(_RESULT_PREFIX):
+            return json.loads(line[len(_RESULT_PREFIX):])
+    # The stage's own output says why it failed (traceback, or e.g. a missing Pillow message)
+    output_lines = (result.stderr.strip() or result.stdout.strip()).splitlines()
+    return {"error": output_lines[-1] if output_lines else f"exit code {result.returncode}"}
+
+def benchmark_size(entry_count, work_dir, image_ratio, duplicate_rate, seed):
+    """Generates one synthetic HAR and runs every stage on it, in pipeline order."""
+    har_path = os.path.join(work_dir, f"synthetic_{entry_count}.har")
+    assets_dir = os.path.join(work_dir, f"assets_{entry_count}")
+    har_stats = write_synthetic_har(har_path, entry_count, image_ratio=image_ratio,
+                                    duplicate_rate=duplicate_rate, seed=seed)
+    har_mb = har_stats["bytes"] / (1024 * 1024)
+
+    results = []
+    for stage in _STAGE_CODE:
+        measurement = run_stage(stage, har_path, assets_dir)
+        if "seconds" in measurement:
+            seconds = max(measurement["seconds"], 1e-9)
+            measurement["entries_per_second"] = round(entry_count / seconds, 1)
+            measurement["mb_per_second"] = round(har_mb / seconds, 2)
+        results.append({"stage": stage, "entries": entry_count, "har_mb": round(har_mb, 2), **measurement})
+    os.remove(har_path)
+    return har_stats, results
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=SCRIPT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the extraction stages on synthetic HAR files and emit JSON.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Entry counts to benchmark.")
+    parser.add_argument("--image-ratio", type=float, default=DEFAULT_IMAGE_RATIO)
+    parser.add_argument("--duplicate-rate", type=float, default=DEFAULT_DUPLICATE_RATE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout.")
+    args = parser.parse_args()
+
+    report = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "generator": {"image_ratio": args.image_ratio, "duplicate_rate": args.duplicate_rate, "seed": args.seed},
+        "inputs": [],
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        for entry_count in args.sizes:
+            print(f"Benchmarking {entry_count} entries...", file=sys.stderr)
+            har_stats, results = benchmark_size(entry_count, work_dir, args.image_ratio, args.duplicate_rate, args.seed)
+            report["inputs"].append(har_stats)
+            report["results"].extend(results)
+            for result in results:
+                if "error" in result:
+                    print(f"  {result['stage']:<32} failed: {result['error']}", file=sys.stderr)
+                else:
+                    print(f"  {result['stage']:<32}{result['seconds']:>8.2f}s{result['mb_per_second']:>9.1f} MB/s"
+                          f"{result['peak_rss_mb']:>9.1f} MB peak", file=sys.stderr)
+
+    report_json = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report_json + "\n")
+        print(f"Benchmark report written to {args.output}", file=sys.stderr)
+    else:
+        print(report_json)
+
+if __name__ == "__main__":
+    main()
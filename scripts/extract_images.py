@@ -1,73 +1,302 @@
-import json
 import base64
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
 import os
 from pathlib import Path
 import re
+import time
+
+from har_pipeline import EntryHandler, register_handler, run_pipeline
+from har_stream import HarFormatError
+from state_store import CONTENT_HASH_FIELD
+
+# Written next to the images; maps each stored file to every HAR entry that produced it
+MANIFEST_FILENAME = "manifest.json"
+
+# Bodies with more base64 characters than this are decoded in chunks straight
+# to a temporary file instead of into one bytes object (GIFs, sprite sheets...)
+STREAM_DECODE_MIN_CHARS = 1024 * 1024
+# Cap on base64 text queued for worker processes in parallel mode
+MAX_PENDING_CHARS = 64 * 1024 * 1024
+# Base64 characters decoded per chunk; a multiple of 4 so chunks end on whole quanta
+DECODE_CHUNK_CHARS = 256 * 1024
+# Plain substring checks; a regex scan would cost more than the decoding itself
+_BASE64_LINE_SEPARATORS = ("\n", "\r", " ", "\t")
+_IMAGE_NUMBER = re.compile(r'image_(\d+)\.')
+
+class ImageExtractor(EntryHandler):
+    """
+    Pipeline handler that saves base64 image entries to output_dir as image_N files.
+
+    With dedup enabled, decoded bytes are hashed (SHA256) and each distinct image
+    is written only once, under the number of its first occurrence; every entry
+    is still recorded in the manifest against the stored file.
+
+    With workers > 0, base64 decoding and hashing run on a process pool (decoding
+    holds the GIL, so threads would not help). Numbers are still assigned and
+    results consumed in entry order, so filenames match a serial run.
+
+    With a state_store, numbering continues from the previous run and the
+    existing manifest is extended, so images already on disk are not rewritten.
+    A new store over a directory written by an earlier (non-incremental) run
+    continues after the highest image number found there.
+
+    Bodies above stream_threshold base64 characters are decoded and hashed
+    chunk by chunk into a hidden temporary file, which is renamed into place
+    or, for a duplicate, deleted; the decoded image is never held in memory.
+    """
+    name = "images"
+    entry_classes = frozenset({"image"})
 
-def extract_images(har_file_path, output_dir):
-    # Create the output directory if it doesn't exist
-    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    def __init__(self, output_dir, workers=0, dedup=True, manifest_path=None, state_store=None,
+                 stream_threshold=STREAM_DECODE_MIN_CHARS):
+        self.output_dir = output_dir
+        self.stream_threshold = stream_threshold
+        self.workers = workers
+        self.dedup = dedup
+        self.manifest_path = manifest_path or os.path.join(output_dir, MANIFEST_FILENAME)
+        self.state_store = state_store
+        self.image_counter = 0
+        self.saved_count = 0
+        self.duplicate_count = 0
+        self.started_at = time.perf_counter()
+        # sha256 -> filename of the stored file (its record is self.manifest[filename])
+        self._files_by_hash = {}
+        self.manifest = {}
+        # Create the output directory if it doesn't exist
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        if state_store is not None:
+            self._load_manifest()
+            self.image_counter = state_store.get_meta("image_counter")
+            if self.image_counter is None:
+                self.image_counter = highest_image_number(output_dir, self.manifest)
+        self._first_image_number = self.image_counter + 1
 
-    # Read the HAR file
+        self._executor = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+        # Bounded so at most a few bodies per worker are queued in memory
+        self._pending = deque()
+        self._max_pending = max(1, workers) * 4
+        # ...and at most this much base64 text, however large the bodies are
+        self._pending_chars = 0
+
+    def _load_manifest(self):
+        """Seeds the hash index from an existing manifest, including variants organize merged away."""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f).get("images", {})
+        except (IOError, ValueError):
+            return
+        for filename, record in self.manifest.items():
+            self._files_by_hash[record["sha256"]] = filename
+            for variant in record.get("replaced_variants", []):
+                self._files_by_hash.setdefault(variant["sha256"], filename)
+
+    def handle_entry(self, entry, entry_index):
+        image = get_base64_image(entry)
+        if image is None:
+            return
+        mime_type, base64_text = image
+        self.image_counter += 1
+        if not base64_text:
+            return
+
+        source = {
+            "image_number": self.image_counter,
+            "entry_index": entry_index,
+            "url": entry.get('request', {}).get('url', ''),
+        }
+        filename = image_filename(self.image_counter, mime_type)
+        content_hash = entry.get(CONTENT_HASH_FIELD)
+        temp_path = None
+        if len(base64_text) > self.stream_threshold:
+            temp_path = os.path.join(self.output_dir, f".{filename}.part")
+            decode, args = decode_image_to_file, (base64_text, temp_path)
+        else:
+            decode, args = decode_image, (base64_text,)
+        if self._executor is None:
+            self._store(decode(*args), filename, mime_type, source, content_hash, temp_path)
+            return
+
+        future = self._executor.submit(decode, *args)
+        self._pending.append((future, filename, mime_type, source, content_hash, temp_path, len(base64_text)))
+        self._pending_chars += len(base64_text)
+        while self._pending and (len(self._pending) >= self._max_pending
+                                 or self._pending_chars > MAX_PENDING_CHARS):
+            self._drain(1)
+
+    def _drain(self, count):
+        for _ in range(min(count, len(self._pending))):
+            future, filename, mime_type, source, content_hash, temp_path, chars = self._pending.popleft()
+            self._pending_chars -= chars
+            self._store(future.result(), filename, mime_type, source, content_hash, temp_path)
+
+    def _store(self, decoded, filename, mime_type, source, content_hash=None, temp_path=None):
+        """
+        decoded is (image_bytes, sha256) from decode_image, or (byte_count, sha256)
+        from decode_image_to_file when the body was streamed to temp_path.
+        """
+        image_data, digest = decoded
+        if digest is None:
+            print(f"Warning: Could not decode base64 for an image entry. Skipping.")
+            return
+
+        if self.dedup and digest in self._files_by_hash:
+            if temp_path is not None:
+                os.remove(temp_path)
+            stored_name = self._files_by_hash[digest]
+            self.manifest[stored_name]["sources"].append(source)
+            self.duplicate_count += 1
+            if self.state_store is not None and content_hash:
+                self.state_store.record_image(content_hash, stored_name, digest)
+            return
+
+        # Write the image data to a file
+        file_path = os.path.join(self.output_dir, filename)
+        try:
+            if temp_path is not None:
+                os.replace(temp_path, file_path)
+                byte_count = image_data
+            else:
+                with open(file_path, 'wb') as img_file:
+                    img_file.write(image_data)
+                byte_count = len(image_data)
+        except IOError as e:
+            print(f"Error writing file {file_path}: {e}")
+            return
+        self.saved_count += 1
+        print(f"Saved: {file_path}")
+
+        record = {"sha256": digest, "bytes": byte_count, "mime_type": mime_type, "sources": [source]}
+        self.manifest[filename] = record
+        self._files_by_hash[digest] = filename
+        if self.state_store is not None and content_hash:
+            self.state_store.record_image(content_hash, filename, digest)
+
+    def finish(self):
+        if self._executor is not None:
+            self._drain(len(self._pending))
+            self._executor.shutdown()
+        if self.state_store is not None:
+            self.state_store.set_meta("image_counter", self.image_counter)
+
+        try:
+            with open(self.manifest_path, 'w', encoding='utf-8') as f:
+                json.dump({"images": self.manifest}, f, ensure_ascii=False, indent=4)
+        except IOError as e:
+            print(f"Error writing manifest {self.manifest_path}: {e}")
+
+        elapsed = time.perf_counter() - self.started_at
+        rate = self.saved_count / elapsed if elapsed > 0 else 0.0
+        mode = f"{self.workers} workers" if self._executor is not None else "serial"
+        found_count = self.image_counter - self._first_image_number + 1
+        if self.dedup:
+            print(f"\nExtraction complete. Found {found_count} images, saved {self.saved_count} "
+                  f"unique files to '{self.output_dir}' ({self.duplicate_count} duplicates not written).")
+        else:
+            print(f"\nExtraction complete. Found and saved {self.saved_count} of {found_count} images to '{self.output_dir}'.")
+        print(f"Processed images in {elapsed:.2f}s ({rate:.1f} images/s written, {mode}).")
+        return {"found": found_count, "saved": self.saved_count, "duplicates": self.duplicate_count}
+
+register_handler(ImageExtractor.name,
+                 lambda config: ImageExtractor(config['assets_dir'], config.get('image_workers', 0),
+                                               config.get('dedup_images', True),
+                                               state_store=config.get('state_store')))
+
+def extract_images(har_file_path, output_dir, workers=0, dedup=True, use_index=False):
+    """
+    Returns {"found", "saved", "duplicates"}, or None if the HAR could not be read.
+    With use_index, only image entries are read (see har_pipeline.run_pipeline).
+    """
+    # Stream the entries of the HAR log one at a time instead of loading the whole file
     try:
-        with open(har_file_path, 'r', encoding='utf-8') as f:
-            har_data = json.load(f)
+        return run_pipeline(har_file_path, [ImageExtractor(output_dir, workers, dedup)],
+                            use_index=use_index)[ImageExtractor.name]
     except FileNotFoundError:
         print(f"Error: HAR file not found at '{har_file_path}'")
-        return
-    except json.JSONDecodeError:
-        print(f"Error: Could not decode JSON from '{har_file_path}'")
-        return
-
-    # Counter for unique filenames
-    image_counter = 0
-
-    # Iterate through the entries in the HAR log
-    for entry in har_data['log']['entries']:
-        response = entry.get('response', {})
-        content = response.get('content', {})
-        mime_type = content.get('mimeType', '')
-        
-        # Check if the entry is an image and is base64 encoded
-        if mime_type.startswith('image/') and content.get('encoding') == 'base64':
-            image_counter += 1
-            
-            # Get the image data and decode it
-            base64_text = content.get('text')
-            if not base64_text:
-                continue
-                
-            try:
-                image_data = base64.b64decode(base64_text)
-            except (ValueError, TypeError):
-                print(f"Warning: Could not decode base64 for an image entry. Skipping.")
-                continue
-
-            # Determine the file extension
-            extension = mime_type.split('/')[-1]
-            if '?' in extension: # clean up cases like 'jpeg?foo=bar'
-                extension = extension.split('?')[0]
-            
-            # Sanitize extension
-            extension = re.sub(r'[^a-zA-Z0-9]', '', extension)
-            if not extension:
-                extension = 'jpg' # default extension
-
-            # Create a unique filename
-            filename = f"image_{image_counter}.{extension}"
-            file_path = os.path.join(output_dir, filename)
-            
-            # Write the image data to a file
-            try:
-                with open(file_path, 'wb') as img_file:
-                    img_file.write(image_data)
-                print(f"Saved: {file_path}")
-            except IOError as e:
-                print(f"Error writing file {file_path}: {e}")
+    except HarFormatError as e:
+        print(f"Error: Could not decode JSON from '{har_file_path}': {e}")
 
-    print(f"\nExtraction complete. Found and saved {image_counter} images to '{output_dir}'.")
+def get_base64_image(entry):
+    """Returns (mime_type, base64_text) if the entry is a base64 encoded image, else None."""
+    response = entry.get('response', {})
+    content = response.get('content', {})
+    mime_type = content.get('mimeType', '')
+
+    # Check if the entry is an image and is base64 encoded
+    if mime_type.startswith('image/') and content.get('encoding') == 'base64':
+        return mime_type, content.get('text')
+    return None
+
+def highest_image_number(output_dir, manifest):
+    """The largest N of the image_N files in output_dir or named in manifest (merged variants included); 0 if none."""
+    names = set(os.listdir(output_dir))
+    for filename, record in manifest.items():
+        names.add(filename)
+        names.update(variant.get("file", "") for variant in record.get("replaced_variants", []))
+    numbers = [int(match.group(1)) for match in map(_IMAGE_NUMBER.match, names) if match]
+    return max(numbers, default=0)
+
+def image_filename(image_number, mime_type):
+    # Determine the file extension
+    extension = mime_type.split('/')[-1]
+    if '?' in extension: # clean up cases like 'jpeg?foo=bar'
+        extension = extension.split('?')[0]
+
+    # Sanitize extension
+    extension = re.sub(r'[^a-zA-Z0-9]', '', extension)
+    if not extension:
+        extension = 'jpg' # default extension
+
+    # Create a unique filename
+    return f"image_{image_number}.{extension}"
+
+def decode_image(base64_text):
+    """
+    Decodes base64_text and returns (image_bytes, sha256_hexdigest), or (None, None)
+    if it is not valid base64. Runs in worker processes in parallel mode.
+    """
+    try:
+        image_data = base64.b64decode(base64_text)
+    except (ValueError, TypeError):
+        return None, None
+    return image_data, hashlib.sha256(image_data).hexdigest()
+
+def decode_image_to_file(base64_text, output_path):
+    """
+    Decodes base64_text into output_path DECODE_CHUNK_CHARS at a time, hashing
+    as it writes, so memory use does not grow with the image. Returns
+    (byte_count, sha256_hexdigest), or (None, None) if it is not valid base64
+    (output_path is then removed). Runs in worker processes in parallel mode.
+    """
+    digest = hashlib.sha256()
+    byte_count = 0
+    carry = ""
+    try:
+        with open(output_path, 'wb') as f:
+            for start in range(0, len(base64_text), DECODE_CHUNK_CHARS):
+                chunk = carry + base64_text[start:start + DECODE_CHUNK_CHARS]
+                if any(separator in chunk for separator in _BASE64_LINE_SEPARATORS):
+                    # Line-wrapped base64: b64decode skips the breaks, but they would shift the quanta
+                    chunk = "".join(chunk.split())
+                usable = len(chunk) - len(chunk) % 4
+                carry = chunk[usable:]
+                data = base64.b64decode(chunk[:usable])
+                digest.update(data)
+                f.write(data)
+                byte_count += len(data)
+            if carry:
+                data = base64.b64decode(carry)  # Raises on a truncated final quantum, like decode_image
+                digest.update(data)
+                f.write(data)
+                byte_count += len(data)
+    except (ValueError, TypeError):
+        os.remove(output_path)
+        return None, None
+    return byte_count, digest.hexdigest()
 
 if __name__ == "__main__":
     har_file_path = 'sources/www.facebook.com.har'
-    output_dir = 'assets' 
+    output_dir = 'assets'
     extract_images(har_file_path, output_dir)
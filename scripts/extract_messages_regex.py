@@ -4,72 +4,136 @@ import re
 import base64
 from datetime import datetime
 
-def extract_message_text_from_har(file_path):
-    extracted_texts = []
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            har_data = json.load(f)
-
-        if 'log' in har_data and 'entries' in har_data['log']:
-            for entry in har_data['log']['entries']:
-                try:
-                    if 'response' in entry and 'content' in entry['response']:
-                        content = entry['response']['content']
-                        content_text = content.get('text')
-                        content_encoding = content.get('encoding')
-
-                        if content_text:
-                            if content_encoding == 'base64':
-                                try:
-                                    decoded_text = base64.b64decode(content_text).decode('utf-8', errors='ignore')
-                                    content_text = decoded_text
-                                except Exception as e:
-                                    continue # Skip this entry if decoding fails
-
-                            # Try to parse content_text as JSON first
-                            try:
-                                json_content = json.loads(content_text)
-                                # The original logic for finding messages in JSON was a placeholder.
-                                # To properly extract 'message.text' from a parsed JSON object,
-                                # you'd need to recursively traverse the JSON structure.
-                                # For simplicity, if the whole content is JSON, and you're looking
-                                # for "message":{"text":"..."} specifically, you might need to
-                                # adjust this part or rely more on the regex for non-JSON content.
-                                # For now, I'll assume the regex part is what you want to primarily
-                                # apply for message extraction, even if the overall content is JSON.
-                                pass
-
-                            except json.JSONDecodeError:
-                                # This block will be executed if content_text is not a complete JSON,
-                                # or if you prefer to use regex even on JSON strings for "message":{"text":"..."}
-                                message_text_pattern = r'"message":{"text":"((?:[^"\\]|\\"|\\\\|\\/|\\b|\\f|\\n|\\r|\\t|\\u[0-9a-fA-F]{4})*?)"}'
-                                message_matches = list(re.finditer(message_text_pattern, content_text))
-
-                                for msg_match in message_matches:
-                                    unescaped_text = ""
-                                    try:
-                                        json_string_to_load = f'"{msg_match.group(1)}"'
-                                        unescaped_text = json.loads(json_string_to_load)
-                                    except json.JSONDecodeError:
-                                        unescaped_text = msg_match.group(1)
-
-                                    # Remove newline characters from the extracted text
-                                    unescaped_text = unescaped_text.replace('\n', '')
-                                    extracted_texts.append(unescaped_text)
-
-                except KeyError:
-                    pass # Skip entries that don't have the expected structure
+from graphql_payload import iter_message_records, split_json_documents
+from har_classify import TEXT_CLASSES
+from har_pipeline import EntryHandler, register_handler, run_pipeline
+from har_stream import HarFormatError
+from state_store import CONTENT_HASH_FIELD
+
+# Fallback for bodies that are not JSON (e.g. HTML pages embedding JSON in <script> tags).
+# The string body is written in "unrolled" form so matching stays linear.
+MESSAGE_TEXT_PATTERN = re.compile(r'"message":\{"text":"([^"\\]*(?:\\.[^"\\]*)*)"')
+
+class MessageExtractor(EntryHandler):
+    """
+    Pipeline handler that collects message records ({"text", "post_id",
+    "timestamp", "media"}) from response bodies. finish() returns the records.
+
+    With a writer (see message_writer.MessageWriter), records are streamed to
+    it as they are found instead of being kept, and finish() returns
+    {"found", "written", "duplicates"}. With a state_store, each entry's
+    records are also saved against its response hash.
+    """
+    name = "messages"
+    entry_classes = TEXT_CLASSES
+
+    def __init__(self, state_store=None, writer=None):
+        self.records = []
+        self.found = 0
+        self.state_store = state_store
+        self.writer = writer
+
+    def handle_entry(self, entry, entry_index):
+        records = extract_message_records_from_entry(entry)
+        self.found += len(records)
+        if self.writer is not None:
+            for record in records:
+                self.writer.write(record)
         else:
-            print(f"Error: Invalid HAR file structure in {file_path}. Missing 'log' or 'entries'.", file=sys.stderr)
+            self.records.extend(records)
+        if self.state_store is not None and records and entry.get(CONTENT_HASH_FIELD):
+            self.state_store.record_messages(entry[CONTENT_HASH_FIELD], records)
+
+    def finish(self):
+        if self.writer is not None:
+            return {"found": self.found, "written": self.writer.written, "duplicates": self.writer.duplicates}
+        return self.records
+
+register_handler(MessageExtractor.name,
+                 lambda config: MessageExtractor(config.get('state_store'), config.get('message_writer')))
+
+def extract_message_records_from_har(file_path, use_index=False):
+    records = []
+    try:
+        # Stream the HAR entries one at a time instead of loading the whole file
+        records = run_pipeline(file_path, [MessageExtractor()], use_index=use_index)[MessageExtractor.name]
 
     except FileNotFoundError:
         print(f"Error: File not found at {file_path}", file=sys.stderr)
-    except json.JSONDecodeError:
-        print(f"Error: Could not decode HAR JSON from {file_path}. Please ensure it's a valid HAR JSON file.", file=sys.stderr)
+    except HarFormatError as e:
+        print(f"Error: Could not decode HAR JSON from {file_path}. Please ensure it's a valid HAR JSON file with 'log.entries'. ({e})", file=sys.stderr)
     except Exception as e:
         print(f"An unexpected error occurred: {e}", file=sys.stderr)
 
-    return extracted_texts
+    return records
+
+def write_message_records_from_har(file_path, writer, use_index=False):
+    """Streams the HAR's message records into writer; returns MessageExtractor's counts, or None on error."""
+    try:
+        return run_pipeline(file_path, [MessageExtractor(writer=writer)], use_index=use_index)[MessageExtractor.name]
+    except FileNotFoundError:
+        print(f"Error: File not found at {file_path}", file=sys.stderr)
+    except HarFormatError as e:
+        print(f"Error: Could not decode HAR JSON from {file_path}. Please ensure it's a valid HAR JSON file with 'log.entries'. ({e})", file=sys.stderr)
+    return None
+
+def extract_message_text_from_har(file_path, use_index=False):
+    return [record["text"] for record in extract_message_records_from_har(file_path, use_index)]
+
+def extract_messages_from_entry(entry):
+    """Returns the "message":{"text":...} strings found in a single HAR entry's response body."""
+    return [record["text"] for record in extract_message_records_from_entry(entry)]
+
+def _clean_text(text):
+    # Remove newline characters from the extracted text
+    return text.replace('\n', '')
+
+def extract_message_records_from_entry(entry):
+    """
+    Returns message records found in a single HAR entry's response body.
+
+    JSON bodies, including newline-delimited GraphQL batches with a
+    "for (;;);" prefix, are walked structurally, which also yields the post
+    id, timestamp and attached media. Whatever does not parse as JSON falls
+    back to a regex that only recovers the text.
+    """
+    records = []
+    try:
+        if 'response' in entry and 'content' in entry['response']:
+            content = entry['response']['content']
+            content_text = content.get('text')
+            content_encoding = content.get('encoding')
+
+            if content_text:
+                if content_encoding == 'base64':
+                    try:
+                        decoded_text = base64.b64decode(content_text).decode('utf-8', errors='ignore')
+                        content_text = decoded_text
+                    except Exception as e:
+                        return records # Skip this entry if decoding fails
+
+                # Cheap substring check before any parsing or regex work
+                if '"message":' not in content_text:
+                    return records
+
+                documents, remainder = split_json_documents(content_text)
+                for document in documents:
+                    for record in iter_message_records(document):
+                        record["text"] = _clean_text(record["text"])
+                        records.append(record)
+
+                if '"message":' in remainder:
+                    for msg_match in MESSAGE_TEXT_PATTERN.finditer(remainder):
+                        try:
+                            unescaped_text = json.loads(f'"{msg_match.group(1)}"')
+                        except json.JSONDecodeError:
+                            unescaped_text = msg_match.group(1)
+                        records.append({"text": _clean_text(unescaped_text), "post_id": None, "timestamp": None, "media": []})
+
+    except KeyError:
+        pass # Skip entries that don't have the expected structure
+
+    return records
 
 def clean_unicode_from_file(file_path):
     try:
@@ -1,40 +1,31 @@
+import argparse
 import os
-import google.generativeai as genai
-from dotenv import load_dotenv
 import sys
+import time
+
+from model_clients import GeminiClient, StubModelClient
+from model_output import UnusableOutputError, stream_to_file, strip_code_fences, write_text_atomic
+from profile_prompt import DEFAULT_TOKEN_BUDGET, PROFILE_SECTIONS, build_profile_context, compose_prompt, estimate_tokens
+from profile_sections import (DEFAULT_CONCURRENCY, DEFAULT_RETRIES, SectionGenerationError, SectionGenerator,
+                              parse_profile)
+from response_cache import ResponseCache
 
 # --- Path Setup ---
 # Get the absolute path of the script's directory
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 # Get the absolute path of the project's root directory (assuming the script is in a 'scripts' folder)
 PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+# Cached model responses, keyed by model name + prompt
+RESPONSE_CACHE_DIR = os.path.join(PROJECT_ROOT, ".cache", "profile_responses")
+DEFAULT_OUT_DIR = os.path.join(PROJECT_ROOT, "out")
+DEFAULT_ASSETS_DIR = os.path.join(PROJECT_ROOT, "assets")
+PROFILE_FILENAME = "company_profile.xml"
+
+def create_gemini_client():
+    """Configures Gemini from .env, lets the user pick a model, and returns a GeminiClient for it."""
+    import google.generativeai as genai
+    from dotenv import load_dotenv
 
-def get_file_contents(directory):
-    """Reads all files in a directory and returns their content as a dictionary."""
-    file_contents = {}
-    # Ensure the directory path is absolute
-    abs_directory = os.path.join(PROJECT_ROOT, directory)
-    if not os.path.isdir(abs_directory):
-        print(f"Warning: Directory not found: {abs_directory}")
-        return file_contents
-
-    for root, _, files in os.walk(abs_directory):
-        for file in files:
-            path = os.path.join(root, file)
-            # Create a relative path to use as a key
-            relative_path = os.path.relpath(path, PROJECT_ROOT)
-            try:
-                with open(path, 'r', encoding='utf-8') as f:
-                    file_contents[relative_path] = f.read()
-            except (UnicodeDecodeError, IOError):
-                # For binary files or files that can't be read, just note their path.
-                file_contents[relative_path] = f"Binary file (not read): {os.path.basename(path)}"
-    return file_contents
-
-def generate_company_profile():
-    """
-    Generates a detailed company profile using Gemini AI based on project files.
-    """
     print("Loading environment variables from .env file...")
     # Load .env from the project root
     dotenv_path = os.path.join(PROJECT_ROOT, '.env')
@@ -90,7 +81,7 @@ def generate_company_profile():
                 print("Invalid input. Please enter a number.")
 
         print(f"\nUsing Gemini model: {selected_model_name}")
-        model = genai.GenerativeModel(selected_model_name)
+        model_client = GeminiClient(selected_model_name)
 
     except AttributeError:
         print("\n---")
@@ -103,65 +94,190 @@ def generate_company_profile():
         print(f"Error initializing or listing Gemini models: {e}")
         sys.exit(1)
 
+    return model_client
 
-    print("Reading files from 'assets' and 'out' directories...")
-    assets_contents = get_file_contents('assets')
-    out_contents = get_file_contents('out')
+def build_context(model_client=None, token_budget=DEFAULT_TOKEN_BUDGET, cache=None, out_dir=DEFAULT_OUT_DIR,
+                  assets_dir=DEFAULT_ASSETS_DIR):
+    """Assembles the data part of the prompt from out_dir and assets_dir, keeping the prompt within token_budget."""
+    print(f"Reading files from '{assets_dir}' and '{out_dir}'...")
+    instructions_tokens = estimate_tokens(compose_prompt(""))
+    # File labels in the prompt are relative to the directory both live in ("out/history.json")
+    root_dir = os.path.commonpath([os.path.abspath(out_dir), os.path.abspath(assets_dir)])
+    context, stats = build_profile_context(
+        out_dir, assets_dir, root_dir,
+        model_client=model_client, token_budget=token_budget, cache=cache,
+        instructions_tokens=instructions_tokens)
+    print(f"Prompt size: ~{stats['total_tokens']} tokens of a {token_budget} token budget "
+          f"(history ~{stats.get('history_tokens', 0)}, assets ~{stats['assets_tokens']}).")
+    return context
 
-    # Construct the prompt
-    prompt_parts = [
-        "You are an expert business consultant and web developer. Your task is to generate a detailed company profile in XML format. This profile will serve as the foundation for building a new website for the company.",
-        "Analyze the provided data, which includes social media history, company introduction, and a list of asset files (images). From this data, create a comprehensive company profile.",
-        "The XML output should be well-structured and include the following sections:",
-        "1. **CompanyDetails**: Basic information like name, tenure, mission, contact info.",
-        "2. **BrandIdentity**: Core branding elements, including brand names used and brand voice.",
-        "3. **ProductsAndServices**: Detailed breakdown of products, services, features, and categories.",
-        "4. **TargetAudience**: Description of the ideal customers.",
-        "5. **MarketPositioning**: Analysis of the company's position in the market, its strengths, and unique selling propositions.",
-        "6. **WebsiteFoundation**: Strategic recommendations for the website, including key sections, features, and calls-to-action.",
-        "7. **ProfileValuation**: An evaluation of the generated profile's completeness and utility for website development.",
-        "\nHere is the data:\n"
-    ]
+def build_prompt(model_client=None, token_budget=DEFAULT_TOKEN_BUDGET, cache=None, out_dir=DEFAULT_OUT_DIR,
+                 assets_dir=DEFAULT_ASSETS_DIR):
+    """Assembles the full profile prompt (all sections in one request)."""
+    return compose_prompt(build_context(model_client, token_budget, cache, out_dir, assets_dir))
 
-    for path, content in out_contents.items():
-        prompt_parts.append(f"--- Content from {path} ---\n{content}\n")
+def get_cached_profile(cache, cache_key):
+    """Returns the cached response for cache_key if there is one and it holds a usable CompanyProfile."""
+    cached = cache.get(cache_key) if cache is not None else None
+    if cached is None:
+        return None
+    try:
+        parse_profile(cached)
+    except ValueError as e:
+        print(f"Ignoring unusable cached response ({e}).")
+        return None
+    return cached
 
-    prompt_parts.append("--- Asset Files (Mainly Images) ---\n")
-    for path in assets_contents.keys():
-        prompt_parts.append(f"- {path}\n")
+def generate_single_request(model_client, token_budget, cache, out_dir=DEFAULT_OUT_DIR,
+                            assets_dir=DEFAULT_ASSETS_DIR):
+    """
+    Requests the whole profile in one prompt and returns the XML without
+    markdown fences. Only a response that parses as a CompanyProfile is
+    cached or returned; otherwise the run stops and the profile is left as it was.
+    """
+    prompt = build_prompt(model_client, token_budget, cache, out_dir, assets_dir)
+    cache_key = ResponseCache.make_key(model_client.name, prompt)
+    generated_xml = get_cached_profile(cache, cache_key)
+
+    if generated_xml is not None:
+        print(f"Using cached response for unchanged inputs (model {model_client.name}, key {cache_key[:12]}).")
+    else:
+        print(f"Generating company profile with {model_client.name}. This may take a moment...")
+        try:
+            generated_xml = model_client.generate(prompt)
+        except Exception as e:
+            print(f"An error occurred while communicating with the Gemini API: {e}")
+            sys.exit(1)
+        try:
+            parse_profile(generated_xml)
+        except ValueError as e:
+            print(f"The model did not return a usable company profile ({e}); nothing was saved or cached.")
+            sys.exit(1)
+        if cache is not None:
+            cache.put(cache_key, generated_xml, model_client.name)
+
+    # Clean up the response from markdown code blocks if present
+    return strip_code_fences(generated_xml)
 
-    prompt = "\n".join(prompt_parts)
+def stream_single_request(model_client, token_budget, cache, output_path, out_dir=DEFAULT_OUT_DIR,
+                          assets_dir=DEFAULT_ASSETS_DIR):
+    """
+    Like generate_single_request, but writes the profile to output_path while
+    it is being generated (fences stripped on the fly) and reports
+    time-to-first-token and total time. output_path is replaced only if the
+    streamed document parses as a CompanyProfile, and only then is it cached.
+    """
+    prompt = build_prompt(model_client, token_budget, cache, out_dir, assets_dir)
+    cache_key = ResponseCache.make_key(model_client.name, prompt)
+    cached = get_cached_profile(cache, cache_key)
+    if cached is not None:
+        print(f"Using cached response for unchanged inputs (model {model_client.name}, key {cache_key[:12]}).")
+        write_text_atomic(output_path, strip_code_fences(cached))
+        return
 
-    print("Generating company profile with Gemini AI. This may take a moment...")
+    print(f"Streaming company profile from {model_client.name} into {output_path}...")
     try:
-        response = model.generate_content(prompt)
-        generated_xml = response.text
+        raw_text, first_token_seconds, total_seconds = stream_to_file(
+            model_client.generate_stream(prompt), output_path,
+            on_first_chunk=lambda seconds: print(f"First tokens after {seconds:.2f}s, writing..."),
+            validate=parse_profile)
+    except UnusableOutputError as e:
+        print(f"The model did not return a usable company profile ({e}); nothing was saved or cached.")
+        print(f"{output_path} was left unchanged.")
+        sys.exit(1)
     except Exception as e:
         print(f"An error occurred while communicating with the Gemini API: {e}")
+        print(f"{output_path} was left unchanged.")
         sys.exit(1)
+    print(f"Streamed {len(raw_text)} characters: time to first token {first_token_seconds:.2f}s, "
+          f"total {total_seconds:.2f}s.")
+    if cache is not None:
+        cache.put(cache_key, raw_text, model_client.name)
 
+def generate_company_profile(model_client=None, use_cache=True, cache=None, token_budget=DEFAULT_TOKEN_BUDGET,
+                             concurrent_sections=False, concurrency=DEFAULT_CONCURRENCY, retries=DEFAULT_RETRIES,
+                             stream=False, out_dir=DEFAULT_OUT_DIR, assets_dir=DEFAULT_ASSETS_DIR):
+    """
+    Generates a detailed company profile using Gemini AI from the extracted
+    data in out_dir and assets_dir, and writes it to out_dir/company_profile.xml.
 
-    # Clean up the response from markdown code blocks if present
-    if '```xml' in generated_xml:
-        generated_xml = generated_xml.split('```xml\n')[1].split('```')[0]
-    elif '```' in generated_xml:
-         generated_xml = generated_xml.split('```\n')[1].split('```')[0]
+    model_client defaults to an interactively selected Gemini model; any object
+    with `name` and generate(prompt) works (see model_clients.StubModelClient).
+    Responses are cached on disk by model name and prompt, so re-running with
+    unchanged inputs returns the stored XML without calling the model.
+    A post history too long for token_budget is summarized first (see profile_prompt).
+
+    With concurrent_sections, each XML section is requested separately, up to
+    `concurrency` at a time with retries, and merged into one CompanyProfile
+    (see profile_sections), so the run takes about as long as the slowest section.
+    Otherwise, stream writes the single response to the file as it arrives.
+    The output file is always replaced atomically.
+    """
+    if model_client is None:
+        model_client = create_gemini_client()
+    if cache is None and use_cache:
+        cache = ResponseCache(RESPONSE_CACHE_DIR)
 
+    output_path = os.path.join(out_dir, PROFILE_FILENAME)
+    if stream and not concurrent_sections:
+        stream_single_request(model_client, token_budget, cache if use_cache else None, output_path, out_dir,
+                              assets_dir)
+        print(f"Company profile XML generated successfully at: {output_path}")
+        return
+
+    if concurrent_sections:
+        context = build_context(model_client, token_budget, cache if use_cache else None, out_dir, assets_dir)
+        print(f"Generating {len(PROFILE_SECTIONS)} profile sections with {model_client.name} "
+              f"({concurrency} at a time)...")
+        generator = SectionGenerator(model_client, concurrency, retries, cache=cache if use_cache else None)
+        start_time = time.perf_counter()
+        try:
+            generated_xml = generator.generate(context)
+        except SectionGenerationError as e:
+            print(f"An error occurred while generating the profile sections: {e}")
+            sys.exit(1)
+        slowest = max(generator.timings.items(), key=lambda item: item[1])
+        print(f"Generated all sections in {time.perf_counter() - start_time:.1f}s "
+              f"(slowest: {slowest[0]} at {slowest[1]:.1f}s).")
+    else:
+        generated_xml = generate_single_request(model_client, token_budget, cache if use_cache else None, out_dir,
+                                                assets_dir)
 
-    output_path = os.path.join(PROJECT_ROOT, "out/company_profile.xml")
     print(f"Saving generated profile to {output_path}...")
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(generated_xml)
+    write_text_atomic(output_path, generated_xml)
 
     print(f"Company profile XML generated successfully at: {output_path}")
 
 if __name__ == "__main__":
-    try:
-        import dotenv
-        import google.generativeai
-    except ImportError:
-        print("One or more required packages are not installed.")
-        print("Please run: pip install python-dotenv google-generativeai")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Generate out/company_profile.xml from the extracted data.")
+    parser.add_argument("--stub", action="store_true", help="Use the offline stub model instead of Gemini.")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the model, ignoring cached responses.")
+    parser.add_argument("--token-budget", type=int, default=DEFAULT_TOKEN_BUDGET,
+                        help=f"Approximate prompt size limit in tokens; longer histories are summarized first (default: {DEFAULT_TOKEN_BUDGET}).")
+    parser.add_argument("--concurrent-sections", action="store_true",
+                        help="Request the seven XML sections concurrently and merge them.")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"Maximum concurrent section requests (default: {DEFAULT_CONCURRENCY}).")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+                        help=f"Retries per section after a failed or unparsable response (default: {DEFAULT_RETRIES}).")
+    parser.add_argument("--stream", action="store_true",
+                        help="Write the profile as it is generated and report time-to-first-token (single-request mode).")
+    parser.add_argument("--out-dir", default=DEFAULT_OUT_DIR,
+                        help="Directory with the extracted history.json/posts.json; the profile is written here too (default: out/).")
+    parser.add_argument("--assets-dir", default=DEFAULT_ASSETS_DIR,
+                        help="Directory with the extracted images (default: assets/).")
+    args = parser.parse_args()
+
+    if not args.stub:
+        try:
+            import dotenv
+            import google.generativeai
+        except ImportError:
+            print("One or more required packages are not installed.")
+            print("Please run: pip install python-dotenv google-generativeai")
+            sys.exit(1)
 
-    generate_company_profile()
\ No newline at end of file
+    generate_company_profile(StubModelClient() if args.stub else None, use_cache=not args.no_cache,
+                             token_budget=args.token_budget, concurrent_sections=args.concurrent_sections,
+                             concurrency=args.concurrency, retries=args.retries, stream=args.stream,
+                             out_dir=args.out_dir, assets_dir=args.assets_dir)
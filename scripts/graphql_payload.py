@@ -0,0 +1,100 @@
+import json
+
+# Anti-JSON-hijacking prefix Facebook puts in front of ajax/GraphQL payloads
+FOR_LOOP_PREFIX = "for (;;);"
+
+# Keys that identify the post a message belongs to, in order of preference
+POST_ID_KEYS = ("post_id", "story_fbid")
+TIMESTAMP_KEYS = ("creation_time", "publish_time", "created_time")
+# Containers of the media attached to a story, and the keys holding media objects in them
+ATTACHMENT_KEYS = ("attachments", "all_subattachments", "attached_story")
+MEDIA_OBJECT_KEYS = ("image", "photo_image", "large_share_image", "preferred_thumbnail", "thumbnailImage")
+
+_decoder = json.JSONDecoder()
+
+def split_json_documents(text):
+    """
+    Splits a response body made of one or more JSON documents (NDJSON batches,
+    optionally prefixed with "for (;;);") into parsed documents.
+
+    Returns (documents, remainder) where remainder is the unparsed tail starting
+    at the first position that is not valid JSON ('' if everything parsed).
+    """
+    documents = []
+    position = 0
+    length = len(text)
+    while True:
+        while position < length and text[position] in " \t\r\n":
+            position += 1
+        if text.startswith(FOR_LOOP_PREFIX, position):
+            position += len(FOR_LOOP_PREFIX)
+            continue
+        if position >= length:
+            return documents, ""
+        try:
+            document, position = _decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            return documents, text[position:]
+        documents.append(document)
+
+def _collect_media(node):
+    """Returns media URIs found under a story's attachment containers."""
+    media = []
+    stack = [node.get(key) for key in ATTACHMENT_KEYS if key in node]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, dict):
+            for key, value in current.items():
+                if key in MEDIA_OBJECT_KEYS and isinstance(value, dict) and isinstance(value.get("uri"), str):
+                    if value["uri"] not in media:
+                        media.append(value["uri"])
+                elif isinstance(value, (dict, list)):
+                    stack.append(value)
+        elif isinstance(current, list):
+            stack.extend(current)
+    return media
+
+def _post_context(node, context):
+    """Returns (post_id, timestamp) for `node`, inheriting whatever it does not define from its ancestors."""
+    post_id, timestamp = context
+    for key in POST_ID_KEYS:
+        if isinstance(node.get(key), (str, int)):
+            post_id = str(node[key])
+            break
+    else:
+        if node.get("__typename") == "Story" and isinstance(node.get("id"), str):
+            post_id = node["id"]
+    for key in TIMESTAMP_KEYS:
+        if isinstance(node.get(key), int):
+            timestamp = node[key]
+            break
+    return post_id, timestamp
+
+def iter_message_records(document):
+    """
+    Walks a parsed GraphQL document iteratively (no recursion limit, linear in
+    its size) and yields a record for every "message": {"text": ...} object:
+    {"text", "post_id", "timestamp", "media"}. post_id and timestamp come from
+    the nearest enclosing object that has them; media from the story's attachments.
+    """
+    # Children are pushed in reverse so records come out in document order
+    stack = [(document, (None, None))]
+    while stack:
+        node, context = stack.pop()
+        if isinstance(node, dict):
+            context = _post_context(node, context)
+            message = node.get("message")
+            if isinstance(message, dict) and isinstance(message.get("text"), str):
+                yield {
+                    "text": message["text"],
+                    "post_id": context[0],
+                    "timestamp": context[1],
+                    "media": _collect_media(node),
+                }
+            children = node.values()
+        elif isinstance(node, list):
+            children = node
+        else:
+            continue
+        stack.extend((child, context) for child in reversed(list(children))
+                     if isinstance(child, (dict, list)))
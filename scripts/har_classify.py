@@ -0,0 +1,112 @@
+from collections import Counter
+
+# Entry classes, decided from metadata only (no body decoding):
+#   empty    - no response body was captured
+#   image    - image/* responses
+#   media    - video, audio and fonts
+#   static   - CSS and JS bundles served from Facebook's static CDN
+#   graphql  - /api/graphql/ and batch GraphQL endpoints
+#   json     - other JSON / NDJSON responses
+#   script   - dynamic JavaScript responses (ajax payloads with a "for (;;);" prefix)
+#   html     - HTML documents, which embed the initial feed data
+#   oversize - text-like bodies above the configured size limit
+#   other    - everything else (octet-stream, protobuf, ...)
+ENTRY_CLASSES = ("empty", "image", "media", "static", "graphql", "json", "script", "html", "oversize", "other")
+
+# Classes that can contain a "message":{"text":...} payload
+TEXT_CLASSES = frozenset({"graphql", "json", "script", "html"})
+
+GRAPHQL_URL_MARKERS = ("/api/graphql", "/graphqlbatch")
+STATIC_URL_MARKERS = ("/rsrc.php/", "static.xx.fbcdn.net")
+
+# Larger text bodies are almost always JS bundles or data dumps without posts
+DEFAULT_MAX_TEXT_BODY_BYTES = 64 * 1024 * 1024
+
+def classify(mime_type, url, body_size, max_text_body_bytes=DEFAULT_MAX_TEXT_BODY_BYTES):
+    """Returns the entry class for a response from its mimeType, request URL and body size."""
+    if not body_size:
+        return "empty"
+    mime_type = (mime_type or "").split(';')[0].strip().lower()
+    url = url or ""
+
+    if mime_type.startswith("image/"):
+        return "image"
+    if mime_type.startswith(("video/", "audio/", "font/")) or "font" in mime_type:
+        return "media"
+    if mime_type == "text/css" or any(marker in url for marker in STATIC_URL_MARKERS):
+        return "static"
+
+    if any(marker in url for marker in GRAPHQL_URL_MARKERS):
+        entry_class = "graphql"
+    elif "json" in mime_type:
+        entry_class = "json"
+    elif "javascript" in mime_type:
+        entry_class = "script"
+    elif mime_type == "text/html":
+        entry_class = "html"
+    else:
+        return "other"
+
+    if body_size > max_text_body_bytes:
+        return "oversize"
+    return entry_class
+
+class EntryClassifier:
+    """
+    Classifies HAR entries before any body is decoded and keeps per-class
+    counters of how many entries (and body bytes) were dispatched or skipped.
+    """
+
+    def __init__(self, max_text_body_bytes=DEFAULT_MAX_TEXT_BODY_BYTES):
+        self.max_text_body_bytes = max_text_body_bytes
+        self.entries = Counter()
+        self.body_bytes = Counter()
+        self.skipped_entries = Counter()
+        self.skipped_bytes = Counter()
+        self.previously_processed = Counter()
+
+    def classify_entry(self, entry):
+        content = entry.get('response', {}).get('content', {})
+        return self.classify_metadata(content.get('mimeType'), entry.get('request', {}).get('url'),
+                                      len(content.get('text') or ''))
+
+    def classify_metadata(self, mime_type, url, body_size):
+        """Classifies and counts an entry known only by its metadata, e.g. from a HAR index."""
+        entry_class = classify(mime_type, url, body_size, self.max_text_body_bytes)
+        self.entries[entry_class] += 1
+        self.body_bytes[entry_class] += body_size
+        return entry_class
+
+    def record_skip(self, entry_class, body_size):
+        """Counts an entry that no handler wanted, i.e. work that was avoided."""
+        self.skipped_entries[entry_class] += 1
+        self.skipped_bytes[entry_class] += body_size
+
+    def record_previously_processed(self, entry_class):
+        """Counts an entry skipped because an earlier incremental run already processed it."""
+        self.previously_processed[entry_class] += 1
+
+    def as_dict(self):
+        return {
+            entry_class: {
+                "entries": self.entries[entry_class],
+                "body_bytes": self.body_bytes[entry_class],
+                "skipped_entries": self.skipped_entries[entry_class],
+                "skipped_bytes": self.skipped_bytes[entry_class],
+                "previously_processed": self.previously_processed[entry_class],
+            }
+            for entry_class in ENTRY_CLASSES if self.entries[entry_class]
+        }
+
+    def print_summary(self):
+        print(f"{'class':<10}{'entries':>10}{'body MB':>12}{'skipped':>10}{'skipped MB':>12}")
+        for entry_class, counts in self.as_dict().items():
+            print(f"{entry_class:<10}{counts['entries']:>10}{counts['body_bytes'] / 1048576:>12.2f}"
+                  f"{counts['skipped_entries']:>10}{counts['skipped_bytes'] / 1048576:>12.2f}")
+        total_bytes = sum(self.body_bytes.values())
+        if total_bytes:
+            avoided = sum(self.skipped_bytes.values()) / total_bytes
+            print(f"Skipped {sum(self.skipped_entries.values())} of {sum(self.entries.values())} entries "
+                  f"({avoided:.0%} of body bytes) without decoding them.")
+        if self.previously_processed:
+            print(f"Skipped {sum(self.previously_processed.values())} entries already processed by an earlier run.")
@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import sys
+
+from har_classify import ENTRY_CLASSES, classify
+from har_stream import (GZIP_SUFFIXES, ZIP_SUFFIXES, ZSTD_SUFFIXES, HarFormatError, count_scanned_bytes,
+                        iter_har_entry_records, split_zip_member)
+
+# Sidecar written next to the HAR: "page.har" -> "page.har.index.jsonl"
+INDEX_SUFFIX = ".index.jsonl"
+INDEX_FORMAT = "har-index"
+INDEX_VERSION = 1
+
+def index_path_for(har_file_path):
+    return har_file_path + INDEX_SUFFIX
+
+def is_indexable(har_file_path):
+    """
+    Only plain HAR files can be indexed: entries of a compressed HAR cannot be
+    reached without decompressing everything before them.
+    """
+    archive, member = split_zip_member(har_file_path)
+    return member is None and not archive.lower().endswith(GZIP_SUFFIXES + ZSTD_SUFFIXES + ZIP_SUFFIXES)
+
+def _har_signature(har_file_path):
+    stat = os.stat(har_file_path)
+    return {"har_size": stat.st_size, "har_mtime_ns": stat.st_mtime_ns}
+
+def entry_record(entry_index, start, end, entry):
+    """
+    The index line for one entry. bodySize is the length of
+    response.content.text, as the entry classifier measures it.
+    """
+    content = entry.get('response', {}).get('content', {})
+    return {
+        "index": entry_index,
+        "start": start,
+        "end": end,
+        "url": entry.get('request', {}).get('url'),
+        "mimeType": content.get('mimeType'),
+        "encoding": content.get('encoding'),
+        "bodySize": len(content.get('text') or ''),
+    }
+
+class HarIndexWriter:
+    """
+    Collects index records during a pass over a HAR and writes the sidecar
+    once the pass is complete. The header ties the index to the HAR's size
+    and mtime as they were when the pass started.
+    """
+
+    def __init__(self, har_file_path, index_path=None):
+        self.har_file_path = har_file_path
+        self.index_path = index_path or index_path_for(har_file_path)
+        self.signature = _har_signature(har_file_path)
+        self.records = []
+
+    def add(self, entry_index, start, end, entry):
+        self.records.append(entry_record(entry_index, start, end, entry))
+
+    def write(self):
+        """Writes the index through a temporary file; returns False (with a warning) if it cannot be written."""
+        header = {"format": INDEX_FORMAT, "version": INDEX_VERSION, **self.signature, "entries": len(self.records)}
+        temp_path = f"{self.index_path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(header) + "\n")
+                for record in self.records:
+                    f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+            os.replace(temp_path, self.index_path)
+        except OSError as e:
+            print(f"Warning: could not write HAR index {self.index_path}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+        return True
+
+def load_har_index(har_file_path, index_path=None):
+    """
+    Returns the index records of har_file_path, or None if there is no index
+    or it no longer matches the HAR (size or mtime changed, other version,
+    truncated).
+    """
+    index_path = index_path or index_path_for(har_file_path)
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            if (not isinstance(header, dict) or header.get("format") != INDEX_FORMAT
+                    or header.get("version") != INDEX_VERSION):
+                return None
+            signature = _har_signature(har_file_path)
+            if any(header.get(key) != value for key, value in signature.items()):
+                return None
+            records = [json.loads(line) for line in f]
+    except (OSError, ValueError):
+        return None
+    if len(records) != header.get("entries"):
+        return None
+    return records
+
+def build_har_index(har_file_path, index_path=None):
+    """Indexes every entry of a plain HAR in one pass and writes the sidecar. Returns the records."""
+    if not is_indexable(har_file_path):
+        raise ValueError(f"Only plain HAR files can be indexed, not {har_file_path}")
+    writer = HarIndexWriter(har_file_path, index_path)
+    entry_index = -1
+    for start, end, entry in iter_har_entry_records(har_file_path):
+        entry_index += 1
+        writer.add(entry_index, start, end, entry)
+        del entry
+    writer.write()
+    return writer.records
+
+def load_or_build_har_index(har_file_path, index_path=None):
+    records = load_har_index(har_file_path, index_path)
+    if records is None:
+        print(f"Indexing {har_file_path}...")
+        records = build_har_index(har_file_path, index_path)
+    return records
+
+def record_class(record):
+    return classify(record["mimeType"], record["url"], record["bodySize"])
+
+def select_entries(records, entry_classes=None, min_body_size=0, url_contains=None):
+    """Filters index records by entry class, minimum body size and a URL substring."""
+    return [
+        record for record in records
+        if (entry_classes is None or record_class(record) in entry_classes)
+        and record["bodySize"] >= min_body_size
+        and (url_contains is None or url_contains in (record["url"] or ""))
+    ]
+
+class IndexedHar:
+    """Reads single entries of a plain HAR from their indexed byte spans."""
+
+    def __init__(self, har_file_path):
+        self.har_file_path = har_file_path
+        self._file = open(har_file_path, 'rb')
+
+    def read_entry(self, record):
+        self._file.seek(record["start"])
+        raw = self._file.read(record["end"] - record["start"])
+        count_scanned_bytes(len(raw))
+        try:
+            text = raw.decode('utf-8')
+            del raw
+            return json.loads(text)
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise HarFormatError(f"Invalid entry at byte {record['start']} (stale index?): {e}") from e
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def iter_indexed_entries(har_file_path, records):
+    """Yields (record, entry) for the given index records, parsing only those entries."""
+    with IndexedHar(har_file_path) as har:
+        for record in records:
+            entry = har.read_entry(record)
+            yield record, entry
+            del entry
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the byte-offset index of a HAR file.")
+    parser.add_argument("har", help="Plain (uncompressed) HAR file.")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index even if it is up to date.")
+    parser.add_argument("--class", dest="entry_classes", action="append", choices=ENTRY_CLASSES,
+                        help="List entries of this class (repeatable).")
+    parser.add_argument("--min-kb", type=float, default=0, help="List entries with bodies of at least this size.")
+    parser.add_argument("--url-contains", help="List entries whose URL contains this text.")
+    args = parser.parse_args()
+
+    if not is_indexable(args.har):
+        print(f"Error: Only plain HAR files can be indexed: {args.har}", file=sys.stderr)
+        sys.exit(1)
+    try:
+        records = build_har_index(args.har) if args.rebuild else load_or_build_har_index(args.har)
+    except FileNotFoundError:
+        print(f"Error: HAR file not found at '{args.har}'", file=sys.stderr)
+        sys.exit(1)
+    except HarFormatError as e:
+        print(f"Error: Could not decode JSON from '{args.har}': {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"{len(records)} entries indexed in {index_path_for(args.har)}")
+
+    if args.entry_classes or args.min_kb or args.url_contains:
+        selected = select_entries(records, args.entry_classes, int(args.min_kb * 1024), args.url_contains)
+        for record in selected:
+            print(f"{record['index']:>7} {record_class(record):<9}{record['bodySize'] / 1024:>10.1f} KB  {record['url']}")
+        print(f"{len(selected)} matching entries, {sum(record['bodySize'] for record in selected) / 1048576:.1f} MB of bodies")
+
+if __name__ == "__main__":
+    main()
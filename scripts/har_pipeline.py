@@ -0,0 +1,127 @@
+from har_classify import EntryClassifier
+from har_index import HarIndexWriter, IndexedHar, is_indexable, load_har_index
+from har_stream import iter_har_entry_records
+from state_store import CONTENT_HASH_FIELD, response_content_hash
+
+# name -> factory(config) returning an EntryHandler. Extractor modules register
+# themselves on import, so new extractors only need to call register_handler.
+_HANDLER_FACTORIES = {}
+
+class EntryHandler:
+    """
+    Base class for extractors that take part in the single-pass pipeline.
+
+    handle_entry() is called with each HAR entry and its index in log.entries,
+    in file order, and finish()
+    once after the last entry; its return value is the handler's result.
+    Handlers only receive entries whose class (see har_classify) is listed in
+    entry_classes; None means every entry.
+    """
+    name = "handler"
+    entry_classes = None
+
+    def handle_entry(self, entry, entry_index):
+        pass
+
+    def finish(self):
+        return None
+
+def register_handler(name, factory):
+    """Registers factory(config) -> EntryHandler under `name`."""
+    _HANDLER_FACTORIES[name] = factory
+
+def registered_handlers():
+    return list(_HANDLER_FACTORIES)
+
+def create_handlers(names, config):
+    """Builds the named handlers. `config` is a dict of paths/options shared by all factories."""
+    handlers = []
+    for name in names:
+        if name not in _HANDLER_FACTORIES:
+            raise KeyError(f"No HAR entry handler registered as '{name}'. Known: {', '.join(_HANDLER_FACTORIES)}")
+        handlers.append(_HANDLER_FACTORIES[name](config))
+    return handlers
+
+def _track_new_entry(entry, entry_class, classifier, state_store, seen_this_run, har_file_path):
+    """Records the entry in the state store; False if an earlier run already processed it."""
+    content_hash = response_content_hash(entry)
+    if content_hash not in seen_this_run and state_store.has_entry(content_hash):
+        classifier.record_previously_processed(entry_class)
+        return False
+    seen_this_run.add(content_hash)
+    entry[CONTENT_HASH_FIELD] = content_hash
+    state_store.record_entry(content_hash, entry.get('request', {}).get('url'), entry_class, har_file_path)
+    return True
+
+def _interested_handlers(handlers, entry_class):
+    return [handler for handler in handlers if handler.entry_classes is None or entry_class in handler.entry_classes]
+
+def run_pipeline(har_file_path, handlers, classifier=None, state_store=None, use_index=False):
+    """
+    Parses the HAR file once and routes every entry to the handlers that
+    accept its class. Entries no handler wants are counted and dropped.
+
+    With a state_store (see state_store.EntryStateStore), each entry's
+    response hash is stored in entry["_contentHash"], and entries already
+    processed by an earlier run are skipped.
+
+    With use_index, a plain HAR's sidecar index (see har_index) is used when it
+    is up to date: entries are classified from the index and only those some
+    handler wants are read and parsed. Without a valid index the full pass
+    runs as usual and writes one for the next run.
+
+    Returns a dict mapping each handler's name to its finish() result.
+    Pass an EntryClassifier to read the per-class counters afterwards.
+    Raises FileNotFoundError or HarFormatError like iter_har_entries.
+    """
+    if classifier is None:
+        classifier = EntryClassifier()
+    # Repeats inside this capture are still processed, as in a full run
+    seen_this_run = set()
+
+    def dispatch(entry, entry_index, entry_class, interested):
+        if state_store is None or _track_new_entry(entry, entry_class, classifier, state_store,
+                                                   seen_this_run, har_file_path):
+            for handler in interested:
+                handler.handle_entry(entry, entry_index)
+
+    index_records = index_writer = None
+    if use_index and is_indexable(har_file_path):
+        index_records = load_har_index(har_file_path)
+        if index_records is None:
+            index_writer = HarIndexWriter(har_file_path)
+
+    if index_records is not None:
+        print(f"Using the entry index of {har_file_path} ({len(index_records)} entries)")
+        with IndexedHar(har_file_path) as har:
+            for record in index_records:
+                entry_class = classifier.classify_metadata(record["mimeType"], record["url"], record["bodySize"])
+                interested = _interested_handlers(handlers, entry_class)
+                if not interested:
+                    classifier.record_skip(entry_class, record["bodySize"])
+                    continue
+                entry = har.read_entry(record)
+                dispatch(entry, record["index"], entry_class, interested)
+                del entry
+    else:
+        # Counted by hand: enumerate's reused result tuple would keep the previous entry alive
+        entry_index = -1
+        for start, end, entry in iter_har_entry_records(har_file_path):
+            entry_index += 1
+            if index_writer is not None:
+                index_writer.add(entry_index, start, end, entry)
+            entry_class = classifier.classify_entry(entry)
+            interested = _interested_handlers(handlers, entry_class)
+            if not interested:
+                classifier.record_skip(entry_class, len(entry.get('response', {}).get('content', {}).get('text') or ''))
+            else:
+                dispatch(entry, entry_index, entry_class, interested)
+            # Release the entry before the next one is parsed, so two large bodies are never held at once
+            del entry
+        if index_writer is not None and index_writer.write():
+            print(f"Wrote the entry index {index_writer.index_path}")
+
+    results = {handler.name: handler.finish() for handler in handlers}
+    if state_store is not None:
+        state_store.commit()
+    return results
@@ -0,0 +1,360 @@
+import contextlib
+import gzip
+import json
+import mmap
+import re
+import zipfile
+import zlib
+
+# Size of each read from the HAR file. Only one entry (plus at most one chunk)
+# is ever held in memory, so this mostly trades syscalls for buffer size.
+CHUNK_SIZE = 1024 * 1024
+
+# Names open_har accepts; anything else is read as a plain HAR
+GZIP_SUFFIXES = ('.gz',)
+ZSTD_SUFFIXES = ('.zst', '.zstd')
+ZIP_SUFFIXES = ('.zip',)
+HAR_SUFFIXES = ('.har', '.har.gz', '.har.zst', '.har.zstd', '.zip')
+# Picks one HAR out of an archive holding several: "captures.zip!page.har"
+ZIP_MEMBER_SEPARATOR = '!'
+
+_WHITESPACE = re.compile(rb'[ \t\r\n]*')
+# Everything inside an object/array that is not a string or a bracket.
+_NON_STRUCTURAL = re.compile(rb'[^"{}\[\]]*')
+_SCALAR = re.compile(rb'[^,}\]\s]*')
+
+_QUOTE, _BACKSLASH = ord('"'), ord('\\')
+_OPENERS, _CLOSERS = b'{[', b'}]'
+_UTF8_BOM = b'\xef\xbb\xbf'
+# Corrupt or truncated compressed input surfaces as one of these while reading
+_DECOMPRESSION_ERRORS = (EOFError, zlib.error, gzip.BadGzipFile, zipfile.BadZipFile)
+
+# HAR bytes consumed by the scanners and indexed reads of this process; mmap
+# reads never show up in /proc/self/io, so stages report this instead
+_scanned_bytes = 0
+
+def scanned_bytes():
+    """Total bytes of (decompressed) HAR scanned or read by entry so far in this process."""
+    return _scanned_bytes
+
+def count_scanned_bytes(byte_count):
+    global _scanned_bytes
+    _scanned_bytes += byte_count
+
+class HarFormatError(ValueError):
+    """Raised when a HAR file is not valid JSON or lacks 'log.entries'."""
+
+class _ByteScanner:
+    """
+    Minimal incremental JSON scanner over a binary stream or an mmap.
+
+    It never builds the whole document: values can be skipped or sliced out as
+    raw bytes, and the buffer is compacted between array elements. An mmap is
+    scanned in place; compacting it only hands the pages already scanned back
+    to the page cache, so they stop counting towards this process's RSS.
+    """
+
+    def __init__(self, stream, chunk_size=CHUNK_SIZE):
+        self._chunk_size = chunk_size
+        self._pos = 0
+        self._base = 0  # Absolute file offset of self._buf[0]
+        self._mapped = isinstance(stream, mmap.mmap)
+        if self._mapped:
+            self._stream = None
+            self._buf = stream
+            self._released = 0  # Start of the mapped pages not yet released
+            self._eof = True
+        else:
+            self._stream = stream
+            self._buf = bytearray()
+            self._eof = False
+
+    @property
+    def offset(self):
+        """Absolute byte offset of the scan position."""
+        return self._base + self._pos
+
+    def _fill(self):
+        if self._eof:
+            return False
+        try:
+            chunk = self._stream.read(self._chunk_size)
+        except _DECOMPRESSION_ERRORS as e:
+            raise self._error(f"Could not decompress HAR ({e})") from e
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf += chunk
+        return True
+
+    def _error(self, message):
+        return HarFormatError(f"{message} at byte {self.offset}")
+
+    def compact(self):
+        """Drops everything before the scan position from the buffer."""
+        if self._mapped:
+            self._release_pages()
+        elif self._pos:
+            del self._buf[:self._pos]
+            self._base += self._pos
+            self._pos = 0
+
+    def _release_pages(self):
+        # madvise needs page-aligned ranges, and one call per chunk is plenty
+        end = self._pos - self._pos % mmap.PAGESIZE
+        if end - self._released >= self._chunk_size and hasattr(mmap, 'MADV_DONTNEED'):
+            self._buf.madvise(mmap.MADV_DONTNEED, self._released, end - self._released)
+            self._released = end
+
+    def skip_bom(self):
+        while len(self._buf) < len(_UTF8_BOM) and self._fill():
+            pass
+        if self._buf[:len(_UTF8_BOM)] == _UTF8_BOM:
+            self._pos = len(_UTF8_BOM)
+
+    def peek(self):
+        """Returns the byte at the scan position, or None at end of stream."""
+        while self._pos >= len(self._buf):
+            if not self._fill():
+                return None
+        return self._buf[self._pos]
+
+    def skip_ws(self):
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf) or not self._fill():
+                return
+
+    def expect(self, char):
+        self.skip_ws()
+        if self.peek() != ord(char):
+            raise self._error(f"Expected '{char}'")
+        self._pos += 1
+
+    def _scan_string(self):
+        """Advances past a string whose opening quote has been consumed."""
+        # bytearray.find is a memchr, which matters for multi-MB base64 bodies
+        while True:
+            quote = self._buf.find(b'"', self._pos)
+            if quote < 0:
+                self._pos = len(self._buf)
+                if not self._fill():
+                    raise self._error("Unterminated string")
+                continue
+            # The quote is escaped if preceded by an odd number of backslashes
+            backslash = quote - 1
+            while self._buf[backslash] == _BACKSLASH:
+                backslash -= 1
+            self._pos = quote + 1
+            if (quote - 1 - backslash) % 2 == 0:
+                return
+
+    def read_key(self):
+        self.skip_ws()
+        start = self._pos
+        self.expect('"')
+        self._scan_string()
+        return json.loads(bytes(self._buf[start:self._pos]))
+
+    def skip_value(self):
+        """Advances past the next JSON value and returns its (start, end) in the buffer."""
+        self.skip_ws()
+        start = self._pos
+        char = self.peek()
+        if char is None:
+            raise self._error("Unexpected end of file")
+        self._pos += 1
+        if char == _QUOTE:
+            self._scan_string()
+        elif char in _OPENERS:
+            depth = 1
+            while depth:
+                self._pos = _NON_STRUCTURAL.match(self._buf, self._pos).end()
+                if self._pos >= len(self._buf):
+                    if not self._fill():
+                        raise self._error("Unterminated object or array")
+                    continue
+                char = self._buf[self._pos]
+                self._pos += 1
+                if char == _QUOTE:
+                    self._scan_string()
+                elif char in _OPENERS:
+                    depth += 1
+                elif char in _CLOSERS:
+                    depth -= 1
+        else:
+            # Numbers, true/false/null: short, but may straddle a chunk boundary
+            while True:
+                self._pos = _SCALAR.match(self._buf, self._pos).end()
+                if self._pos < len(self._buf) or not self._fill():
+                    break
+        return start, self._pos
+
+    def slice(self, start, end):
+        if self._mapped:
+            return self._buf[start:end]
+        # Through a memoryview: slicing the bytearray directly would copy twice
+        return bytes(memoryview(self._buf)[start:end])
+
+    def pop_slice(self, start, end):
+        """
+        Like slice(), but also drops everything up to `end` (the scan position)
+        from the buffer, so a large element is not held twice while the caller
+        works on the returned copy.
+        """
+        raw = self.slice(start, end)
+        self.compact()
+        return raw
+
+    def enter_object_key(self, key):
+        """Positions the scanner at the value of `key` in the object that starts here."""
+        self.expect('{')
+        self.skip_ws()
+        if self.peek() == ord('}'):
+            raise self._error(f"Missing '{key}'")
+        while True:
+            name = self.read_key()
+            self.expect(':')
+            if name == key:
+                return
+            self.skip_value()
+            self.skip_ws()
+            if self.peek() != ord(','):
+                raise self._error(f"Missing '{key}'")
+            self._pos += 1
+
+    def iter_array(self):
+        """Yields (absolute_start, absolute_end, raw_bytes) for each array element."""
+        self.expect('[')
+        self.skip_ws()
+        if self.peek() == ord(']'):
+            self._pos += 1
+            return
+        while True:
+            self.compact()
+            start, end = self.skip_value()
+            yield self._base + start, self._base + end, self.pop_slice(start, end)
+            self.skip_ws()
+            char = self.peek()
+            self._pos += 1
+            if char == ord(']'):
+                return
+            if char != ord(','):
+                raise self._error("Expected ',' or ']' in array")
+
+def split_zip_member(har_file_path):
+    """Splits "archive.zip!member.har" into (archive, member); member is None without a separator."""
+    archive, separator, member = har_file_path.partition(ZIP_MEMBER_SEPARATOR)
+    if separator and archive.lower().endswith(ZIP_SUFFIXES):
+        return archive, member
+    return har_file_path, None
+
+def list_zip_members(archive_path):
+    """Names of the .har files inside a zip archive, sorted."""
+    with zipfile.ZipFile(archive_path) as archive:
+        return sorted(name for name in archive.namelist() if name.lower().endswith('.har'))
+
+def _open_zip_member(archive_path, member):
+    try:
+        archive = zipfile.ZipFile(archive_path)
+    except zipfile.BadZipFile as e:
+        raise HarFormatError(f"Not a zip archive: {archive_path}: {e}") from e
+    if member is None:
+        members = sorted(name for name in archive.namelist() if name.lower().endswith('.har'))
+        if not members:
+            archive.close()
+            raise HarFormatError(f"No .har file inside {archive_path}")
+        member = members[0]
+    try:
+        # ZipFile keeps the archive open until the member stream is closed
+        return archive.open(member)
+    except KeyError as e:
+        raise HarFormatError(f"No member '{member}' in {archive_path}") from e
+    finally:
+        archive.close()
+
+def _open_zstd(har_file_path):
+    try:
+        import zstandard
+    except ImportError:
+        raise HarFormatError(f"Reading {har_file_path} needs the zstandard library. "
+                             "Please install it using: pip install zstandard") from None
+    # Closing the reader closes the file too; read_across_frames covers multi-frame (pzstd) output
+    return zstandard.ZstdDecompressor().stream_reader(open(har_file_path, 'rb'), read_across_frames=True)
+
+@contextlib.contextmanager
+def open_har(har_file_path):
+    """
+    Opens a HAR for reading as bytes, whatever it is stored as: gzip (.gz) and
+    zstd (.zst) files and HARs inside a zip archive ("archive.zip" for its
+    first .har, "archive.zip!name.har" for a given one) are decompressed while
+    they are read, never to a temporary file. Plain files are memory-mapped.
+
+    Yields an mmap or a file-like object with read(). Offsets into it are
+    offsets into the decompressed HAR. Raises FileNotFoundError or
+    HarFormatError.
+    """
+    archive, member = split_zip_member(har_file_path)
+    name = archive.lower()
+    if name.endswith(ZIP_SUFFIXES):
+        stream = _open_zip_member(archive, member)
+    elif name.endswith(GZIP_SUFFIXES):
+        stream = gzip.open(har_file_path, 'rb')
+    elif name.endswith(ZSTD_SUFFIXES):
+        stream = _open_zstd(har_file_path)
+    else:
+        stream = open(har_file_path, 'rb')
+        try:
+            mapped = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            mapped = None  # Empty files and pipes cannot be mapped; read them instead
+        if mapped is not None:
+            stream.close()
+            stream = mapped
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+    with stream:
+        yield stream
+
+def iter_har_entry_spans(har_file_path, chunk_size=CHUNK_SIZE):
+    """
+    Streams `log.entries` of a HAR file, yielding (start, end, raw_json_bytes)
+    for each entry, where start/end are byte offsets into the (decompressed)
+    HAR. See open_har for the formats it reads.
+    """
+    with open_har(har_file_path) as f:
+        scanner = _ByteScanner(f, chunk_size)
+        scanner.skip_bom()
+        scanner.enter_object_key('log')
+        try:
+            scanner.enter_object_key('entries')
+            yield from scanner.iter_array()
+        finally:
+            count_scanned_bytes(scanner.offset)
+
+def iter_har_entry_records(har_file_path, chunk_size=CHUNK_SIZE):
+    """Like iter_har_entries, but yields (start, end, entry) with the entry's byte span."""
+    for start, end, raw in iter_har_entry_spans(har_file_path, chunk_size):
+        try:
+            # Decode and drop the bytes before parsing, so at most two copies
+            # of a large entry exist at any time
+            text = raw.decode('utf-8')
+            del raw
+            entry = json.loads(text)
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise HarFormatError(f"Invalid entry at byte {start}: {e}") from e
+        del text
+        yield start, end, entry
+        # Not kept alive while the next entry is read
+        del entry
+
+def iter_har_entries(har_file_path, chunk_size=CHUNK_SIZE):
+    """
+    Streams the entries of a HAR file one at a time as dictionaries.
+
+    Unlike json.load, peak memory is bounded by the largest single entry rather
+    than the whole file. Raises FileNotFoundError or HarFormatError.
+    """
+    for _, _, entry in iter_har_entry_records(har_file_path, chunk_size):
+        yield entry
+        del entry
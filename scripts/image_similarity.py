@@ -0,0 +1,137 @@
+import math
+
+try:
+    from PIL import Image, ImageStat
+except ImportError as e:
+    raise ImportError("Pillow library not found. Please install it using: pip install Pillow") from e
+
+# Max Hamming distance between two 64-bit dHashes for them to count as the
+# same picture. Re-encodes and resizes of one photo usually land within 0-4.
+DEFAULT_HAMMING_THRESHOLD = 6
+# Pictures whose grayscale thumbnail varies less than this (standard deviation
+# of 0-255 levels) are flat: solid fills, plain banners. Their hashes are all
+# or nearly all zero whatever they show, so they are never matched perceptually.
+LOW_DETAIL_STDDEV = 12.0
+
+_DCT_SIZE = 32
+_DCT_KEPT = 8
+# cos(pi * (2x + 1) * u / 2N) for the lowest _DCT_KEPT frequencies u
+_DCT_COSINES = [[math.cos(math.pi * (2 * x + 1) * u / (2 * _DCT_SIZE)) for x in range(_DCT_SIZE)]
+                for u in range(_DCT_KEPT)]
+
+def dhash(img, hash_size=8):
+    """
+    Difference hash of a PIL image: compares horizontally adjacent pixels of a
+    (hash_size + 1) x hash_size grayscale thumbnail. Robust to scaling and
+    re-compression, so different renditions of one photo get (nearly) the same hash.
+    """
+    thumbnail = img.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(thumbnail.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] < pixels[offset + col + 1])
+    return value
+
+def phash(img):
+    """
+    DCT perceptual hash of a PIL image: one bit per coefficient of the lowest
+    8x8 frequencies of a 32x32 grayscale thumbnail, set if it is above their
+    median. It looks at the picture differently from dhash, so the two rarely
+    agree by accident.
+    """
+    size = _DCT_SIZE
+    pixels = list(img.convert('L').resize((size, size), Image.LANCZOS).getdata())
+    # The 2-D DCT is separable: transform the rows, then the columns of the result
+    rows = [[sum(c * p for c, p in zip(cosines, pixels[y * size:(y + 1) * size])) for cosines in _DCT_COSINES]
+            for y in range(size)]
+    coefficients = [sum(cosines[y] * rows[y][u] for y in range(size))
+                    for cosines in _DCT_COSINES for u in range(_DCT_KEPT)]
+    # The DC term (overall brightness) would skew the median
+    median = sorted(coefficients[1:])[len(coefficients) // 2 - 1]
+    value = 0
+    for coefficient in coefficients:
+        value = (value << 1) | (coefficient > median)
+    return value
+
+def is_low_detail(img):
+    """True for flat or near-uniform pictures, whose perceptual hashes say nothing about what they show."""
+    thumbnail = img.convert('L').resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS)
+    return ImageStat.Stat(thumbnail).stddev[0] < LOW_DETAIL_STDDEV
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+class HammingIndex:
+    """
+    Multi-index hash for finding hashes within a fixed Hamming distance.
+
+    Each hash is split into threshold + 1 bit ranges. By the pigeonhole
+    principle, two hashes within `threshold` bits of each other must agree
+    exactly on at least one range. A lookup therefore only checks the hashes
+    that share a bucket with the query, not every stored hash.
+
+    This is used instead of a BK-tree: dHash distances cluster around 32 bits,
+    so a BK-tree search with a radius of a few bits still visits most of the
+    tree.
+    """
+
+    def __init__(self, threshold, hash_bits=64):
+        self.threshold = threshold
+        parts = threshold + 1
+        bounds = [(hash_bits * i // parts, hash_bits * (i + 1) // parts) for i in range(parts)]
+        self._ranges = [(low, (1 << (high - low)) - 1) for low, high in bounds]
+        self._tables = [{} for _ in self._ranges]
+        self._keys = []
+        self._items = []
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key, item):
+        index = len(self._keys)
+        self._keys.append(key)
+        self._items.append(item)
+        for table, (shift, mask) in zip(self._tables, self._ranges):
+            table.setdefault((key >> shift) & mask, []).append(index)
+
+    def search(self, key):
+        """Returns [(distance, item)] for every stored hash within the threshold of key."""
+        matches = []
+        checked = set()
+        for table, (shift, mask) in zip(self._tables, self._ranges):
+            for index in table.get((key >> shift) & mask, ()):
+                if index in checked:
+                    continue
+                checked.add(index)
+                distance = hamming_distance(key, self._keys[index])
+                if distance <= self.threshold:
+                    matches.append((distance, self._items[index]))
+        return matches
+
+def group_near_duplicates(hashed_items, threshold=DEFAULT_HAMMING_THRESHOLD, confirm=None):
+    """
+    Clusters (hash, item) pairs, which must come best copy first. Each item
+    joins the cluster of the closest earlier cluster head (its best copy)
+    within `threshold`, provided confirm(item, head) is true when given, or
+    heads a new cluster. Items are compared with cluster heads only, so
+    matches are never chained from one member to the next. Items with a None
+    hash are never grouped. Returns a list of item lists, head first.
+    """
+    clusters = []
+    hash_index = HammingIndex(threshold)
+    for key, item in hashed_items:
+        cluster = None
+        if key is not None:
+            for _, cluster_index in sorted(hash_index.search(key), key=lambda match: match[0]):
+                if confirm is None or confirm(item, clusters[cluster_index][0]):
+                    cluster = clusters[cluster_index]
+                    break
+        if cluster is not None:
+            cluster.append(item)
+            continue
+        clusters.append([item])
+        if key is not None:
+            hash_index.add(key, len(clusters) - 1)
+    return clusters
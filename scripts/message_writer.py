@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import re
+import unicodedata
+
+MESSAGES_FILENAME = "messages.jsonl"
+
+_WHITESPACE_RUN = re.compile(r'\s+')
+
+def normalize_text(text):
+    """NFKC-normalizes text and collapses runs of whitespace, so re-encoded copies of a post compare equal."""
+    return _WHITESPACE_RUN.sub(' ', unicodedata.normalize('NFKC', text)).strip()
+
+def message_key(record):
+    """
+    Dedup key of a message record: its post id and normalized text. GraphQL
+    pagination sends the same story several times; records without a post id
+    (regex fallback) are keyed by text alone.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update((record.get("post_id") or "").encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(normalize_text(record["text"]).encode('utf-8', errors='surrogatepass'))
+    return digest.digest()
+
+def iter_message_file(jsonl_path):
+    """Yields the records of a messages.jsonl file; a missing file yields nothing."""
+    try:
+        f = open(jsonl_path, 'r', encoding='utf-8')
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+class MessageWriter:
+    """
+    Writes message records to a JSONL file as they are found, one per line,
+    dropping repeats (see message_key). Only 16-byte keys are kept in memory,
+    never the records.
+
+    A fresh file is written next to jsonl_path and moved into place by
+    close(), so an interrupted run leaves the previous file intact. With
+    append=True, records already in the file are skipped and new ones are
+    added at its end. With normalize=True the stored text is normalize_text()'d.
+    """
+
+    def __init__(self, jsonl_path, append=False, normalize=False):
+        self.jsonl_path = jsonl_path
+        self.append = append
+        self.normalize = normalize
+        self.written = 0
+        self.duplicates = 0
+        self._keys = set()
+        if append:
+            for record in iter_message_file(jsonl_path):
+                self._keys.add(message_key(record))
+            self._temp_path = None
+            self._file = open(jsonl_path, 'a', encoding='utf-8')
+        else:
+            self._temp_path = f"{jsonl_path}.tmp"
+            self._file = open(self._temp_path, 'w', encoding='utf-8')
+        self.existing = len(self._keys)
+
+    def write(self, record):
+        """Writes the record unless an equal one was written before; returns whether it was new."""
+        if self.normalize:
+            record = dict(record, text=normalize_text(record["text"]))
+        key = message_key(record)
+        if key in self._keys:
+            self.duplicates += 1
+            return False
+        self._keys.add(key)
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.written += 1
+        return True
+
+    def seed(self, records):
+        """Adds records from an older output (e.g. posts.json) as if they had been in the file already."""
+        written, duplicates = self.written, self.duplicates
+        for record in records:
+            self.write(record)
+        self.existing += self.written - written
+        self.written, self.duplicates = written, duplicates
+
+    def close(self):
+        self._file.close()
+        if self._temp_path is not None:
+            os.replace(self._temp_path, self.jsonl_path)
+            self._temp_path = None
+
+    def abort(self):
+        """Closes the writer without replacing the previous file (appended lines stay)."""
+        self._file.close()
+        if self._temp_path is not None and os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+            self._temp_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def _export_json_array(items, output_path):
+    """Writes items as a JSON array formatted like json.dump(..., indent=4), one item at a time."""
+    temp_path = f"{output_path}.tmp"
+    count = 0
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        for item in items:
+            f.write("[\n    " if count == 0 else ",\n    ")
+            f.write(json.dumps(item, ensure_ascii=False, indent=4).replace("\n", "\n    "))
+            count += 1
+        f.write("\n]" if count else "[]")
+    os.replace(temp_path, output_path)
+    return count
+
+def export_history(jsonl_path, history_json_file_path):
+    """Writes the texts of messages.jsonl as the history.json array of strings. Returns the count."""
+    return _export_json_array((record["text"] for record in iter_message_file(jsonl_path)), history_json_file_path)
+
+def export_posts(jsonl_path, posts_json_file_path):
+    """Writes the records of messages.jsonl as the posts.json array. Returns the count."""
+    return _export_json_array(iter_message_file(jsonl_path), posts_json_file_path)
@@ -0,0 +1,74 @@
+import time
+
+# Model clients expose `name` (part of the response cache key),
+# generate(prompt) -> str and generate_stream(prompt), which yields the
+# response text in chunks as it is produced. generate_company_profile
+# accepts any of them, so a local stub can replace Gemini for tests and benchmarks.
+
+class GeminiClient:
+    """Calls a Gemini model through google.generativeai (genai.configure must have been called)."""
+
+    def __init__(self, model_name):
+        import google.generativeai as genai
+        self.name = model_name
+        self._model = genai.GenerativeModel(model_name)
+
+    def generate(self, prompt):
+        response = self._model.generate_content(prompt)
+        return response.text
+
+    def generate_stream(self, prompt):
+        for chunk in self._model.generate_content(prompt, stream=True):
+            if chunk.text:
+                yield chunk.text
+
+STUB_PROFILE_XML = """```xml
+<?xml version="1.0" encoding="UTF-8"?>
+<CompanyProfile>
+    <CompanyDetails><Name>Stub Company</Name></CompanyDetails>
+    <BrandIdentity><BrandVoice>Stub</BrandVoice></BrandIdentity>
+    <ProductsAndServices><Product>Stub product</Product></ProductsAndServices>
+    <TargetAudience><Segment>Stub audience</Segment></TargetAudience>
+    <MarketPositioning><Strength>Stub strength</Strength></MarketPositioning>
+    <WebsiteFoundation><Section>Home</Section></WebsiteFoundation>
+    <ProfileValuation><Completeness>Stub</Completeness></ProfileValuation>
+</CompanyProfile>
+```
+"""
+
+class StubModelClient:
+    """
+    Offline stand-in for a model: returns a fixed response (by default a small
+    CompanyProfile wrapped in a markdown fence) after an optional delay, and
+    records every prompt it was given. response_text may also be a function
+    of the prompt, e.g. to answer per-section prompts or to raise errors.
+    generate_stream() hands the response out in chunk_size pieces, spreading
+    the delay over them.
+    """
+
+    def __init__(self, response_text=STUB_PROFILE_XML, delay=0.0, name="local-stub", chunk_size=64):
+        self.name = name
+        self.response_text = response_text
+        self.delay = delay
+        self.chunk_size = chunk_size
+        self.prompts = []
+
+    def generate(self, prompt):
+        self.prompts.append(prompt)
+        if self.delay:
+            time.sleep(self.delay)
+        return self._respond(prompt)
+
+    def _respond(self, prompt):
+        if callable(self.response_text):
+            return self.response_text(prompt)
+        return self.response_text
+
+    def generate_stream(self, prompt):
+        self.prompts.append(prompt)
+        text = self._respond(prompt)
+        chunk_count = max(1, -(-len(text) // self.chunk_size))
+        for start in range(0, len(text), self.chunk_size):
+            if self.delay:
+                time.sleep(self.delay / chunk_count)
+            yield text[start:start + self.chunk_size]
@@ -0,0 +1,134 @@
+import os
+import re
+import time
+
+FENCE = "```"
+# A line that starts (after indentation) with a tag: where an unfenced document begins
+_LINE_START_TAG = re.compile(r'(?:^|\n)[ \t]*(<)')
+
+class UnusableOutputError(ValueError):
+    """A completed stream whose text failed validation; the output file was left unchanged."""
+
+def strip_code_fences(text):
+    """
+    Returns the document in a model response: the content of its first
+    ``` (or ```xml) fence, or without one, the text from the first line
+    starting with '<' (all of it if there is none). This is FenceStripper run
+    over the whole text, so streamed and complete responses give the same result.
+    """
+    stripper = FenceStripper()
+    return stripper.feed(text) + stripper.finish()
+
+class FenceStripper:
+    """
+    Incremental strip_code_fences for streamed responses. feed() returns the
+    part of each chunk that belongs in the output, as early as possible:
+
+    - text before the document (a preamble like "Here is the <Company> XML:")
+      is held until a fence, or a line starting with '<', shows where the
+      document starts;
+    - inside a fence, everything up to the closing ``` is passed through,
+      holding back only trailing backticks that might start the closing fence;
+    - anything after the closing fence is dropped.
+    """
+
+    def __init__(self):
+        self._state = "start"  # start -> (opening | plain | fenced) -> done
+        self._buffer = ""
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        output = []
+        while self._buffer:
+            if self._state == "start":
+                # The whole buffer is searched again: a fence may arrive split over chunks
+                fence_at = self._buffer.find(FENCE)
+                tag_match = _LINE_START_TAG.search(self._buffer)
+                tag_at = tag_match.start(1) if tag_match else -1
+                if tag_at != -1 and (fence_at == -1 or tag_at < fence_at):
+                    self._state = "plain"
+                    self._buffer = self._buffer[tag_at:]
+                elif fence_at != -1:
+                    self._state = "opening"
+                    self._buffer = self._buffer[fence_at + len(FENCE):]
+                else:
+                    break
+            elif self._state == "opening":
+                # Skip the rest of the opening fence line (the "xml" language tag)
+                newline_at = self._buffer.find("\n")
+                if newline_at == -1:
+                    break
+                self._state = "fenced"
+                self._buffer = self._buffer[newline_at + 1:]
+            elif self._state == "fenced":
+                fence_at = self._buffer.find(FENCE)
+                if fence_at != -1:
+                    output.append(self._buffer[:fence_at])
+                    self._state = "done"
+                    self._buffer = ""
+                    break
+                keep = len(self._buffer) - len(self._buffer.rstrip("`"))
+                output.append(self._buffer[:len(self._buffer) - keep])
+                self._buffer = self._buffer[len(self._buffer) - keep:]
+                break
+            elif self._state == "plain":
+                output.append(self._buffer)
+                self._buffer = ""
+            else:
+                self._buffer = ""
+        return "".join(output)
+
+    def finish(self):
+        """Returns whatever is still held back once the stream has ended."""
+        remainder = self._buffer if self._state in ("start", "fenced", "plain") else ""
+        self._buffer = ""
+        self._state = "done"
+        return remainder
+
+def stream_to_file(chunks, output_path, on_first_chunk=None, validate=None):
+    """
+    Writes streamed response chunks to output_path without their code fences.
+    The text goes to a temporary file next to output_path that replaces it
+    only once the stream has completed, so a failed or interrupted generation
+    never leaves a half-written file behind. validate(text), if given, is
+    called with the temporary file's text first; a ValueError from it (e.g.
+    for an empty or truncated document) is raised as UnusableOutputError and
+    output_path is not touched.
+
+    Returns (raw_text, time_to_first_chunk, total_seconds).
+    """
+    temp_path = f"{output_path}.tmp"
+    stripper = FenceStripper()
+    raw_parts = []
+    start_time = time.perf_counter()
+    first_chunk_time = None
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for chunk in chunks:
+                if first_chunk_time is None:
+                    first_chunk_time = time.perf_counter() - start_time
+                    if on_first_chunk is not None:
+                        on_first_chunk(first_chunk_time)
+                raw_parts.append(chunk)
+                f.write(stripper.feed(chunk))
+                f.flush()
+            f.write(stripper.finish())
+        if validate is not None:
+            with open(temp_path, 'r', encoding='utf-8') as f:
+                try:
+                    validate(f.read())
+                except ValueError as e:
+                    raise UnusableOutputError(str(e)) from e
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return "".join(raw_parts), first_chunk_time, time.perf_counter() - start_time
+
+def write_text_atomic(path, text):
+    """Writes text to path through a temporary file and os.replace."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_path, path)
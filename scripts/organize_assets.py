@@ -1,99 +1,268 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 import os
 import hashlib
+import json
 import shutil
-from pathlib import Path
+
+from extract_images import MANIFEST_FILENAME
+from image_similarity import (DEFAULT_HAMMING_THRESHOLD, dhash, group_near_duplicates, hamming_distance,
+                              is_low_detail, phash)
 
 try:
     from PIL import Image
-except ImportError:
-    print("Pillow library not found. Please install it using: pip install Pillow")
-    exit()
+except ImportError as e:
+    # Raised rather than exiting so run_all's batch workers can report the page as failed
+    raise ImportError("Pillow library not found. Please install it using: pip install Pillow") from e
+
+# Per-directory cache of hashes and image sizes, keyed by filename and
+# validated against size + mtime so unchanged files are never re-read
+CACHE_FILENAME = ".asset_cache.json"
+HASH_BLOCK_SIZE = 1024 * 1024
+# Near-duplicates merged into a better copy are moved here, not deleted
+MERGED_DIRNAME = ".merged"
+# Relative difference in width/height allowed between near-duplicates
+ASPECT_RATIO_TOLERANCE = 0.05
 
 def get_file_hash(filepath):
     """Calculates the SHA256 hash of a file."""
     sha256_hash = hashlib.sha256()
     with open(filepath, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
+        for byte_block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
             sha256_hash.update(byte_block)
     return sha256_hash.hexdigest()
 
-def organize_and_copy_assets(target_dir):
+def write_json_atomic(path, data):
+    """Writes JSON to a temporary file and renames it over `path`, so readers never see a partial file."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    os.replace(temp_path, path)
+
+def load_asset_cache(target_dir):
+    cache_path = os.path.join(target_dir, CACHE_FILENAME)
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+def probe_image(filepath, stat_result, cached, perceptual):
+    """
+    Returns the cache record for one file: SHA256, dimensions and, if needed,
+    its dHash, pHash and whether it is too flat to compare perceptually.
+    Reuses `cached` when size and mtime are unchanged. Runs on a worker thread
+    (hashlib and Pillow release the GIL while reading/decoding).
+    """
+    unchanged = (cached is not None and cached.get("size") == stat_result.st_size
+                 and cached.get("mtime_ns") == stat_result.st_mtime_ns and "width" in cached)
+    if unchanged and (not perceptual or cached.get("phash") is not None):
+        return cached
+
+    record = {"size": stat_result.st_size, "mtime_ns": stat_result.st_mtime_ns}
+    record["hash"] = cached["hash"] if unchanged else get_file_hash(filepath)
+    with Image.open(filepath) as img:
+        record["width"], record["height"] = img.size
+        record["resolution"] = record["width"] * record["height"]
+        record["dhash"] = dhash(img) if perceptual else None
+        record["phash"] = phash(img) if perceptual else None
+        record["low_detail"] = is_low_detail(img) if perceptual else None
+    return record
+
+def _quality(record):
+    # Highest resolution, then largest file
+    return record['resolution'], record['size_kb']
+
+def is_same_picture(record, best, threshold):
+    """
+    Confirms a dHash match between two image records: their aspect ratios must
+    agree and their pHashes be within `threshold` as well.
+    """
+    if not record["height"] or not best["height"]:
+        return False
+    ratio = (record["width"] / record["height"]) / (best["width"] / best["height"])
+    if abs(ratio - 1) > ASPECT_RATIO_TOLERANCE:
+        return False
+    return hamming_distance(record["phash"], best["phash"]) <= threshold
+
+def move_aside(path, target_dir):
+    """Moves a merged near-duplicate into target_dir/.merged and returns its new path."""
+    merged_dir = os.path.join(target_dir, MERGED_DIRNAME)
+    os.makedirs(merged_dir, exist_ok=True)
+    name, extension = os.path.splitext(os.path.basename(path))
+    destination = os.path.join(merged_dir, name + extension)
+    suffix = 1
+    while os.path.exists(destination):
+        # An earlier run moved a different file with this name
+        destination = os.path.join(merged_dir, f"{name}_{suffix}{extension}")
+        suffix += 1
+    os.replace(path, destination)
+    return destination
+
+def merge_manifest_sources(target_dir, replaced, moved=None):
+    """
+    Re-points manifest records of removed files at the file that replaced them.
+    `replaced` maps removed filename -> kept filename, `moved` maps the
+    filenames that were moved aside rather than deleted -> their new path.
+    """
+    moved = moved or {}
+    manifest_path = os.path.join(target_dir, MANIFEST_FILENAME)
+    if not replaced or not os.path.isfile(manifest_path):
+        return
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    images = manifest.get("images", {})
+    for removed_name, kept_name in replaced.items():
+        removed = images.pop(removed_name, None)
+        kept = images.get(kept_name)
+        if removed is None or kept is None:
+            continue
+        kept["sources"].extend(removed.get("sources", []))
+        variant = {"file": removed_name, "sha256": removed.get("sha256")}
+        if removed_name in moved:
+            variant["moved_to"] = moved[removed_name]
+        kept.setdefault("replaced_variants", []).append(variant)
+
+    write_json_atomic(manifest_path, manifest)
+
+def organize_and_copy_assets(target_dir, perceptual=False, threshold=DEFAULT_HAMMING_THRESHOLD, workers=None):
     """
-    Groups images by content, finds the best quality version of each, 
+    Groups images by content, finds the best quality version of each,
     and organizes them in-place within the target directory.
+
+    Byte-identical files (same SHA256) are grouped and all but the best copy
+    deleted. With perceptual=True, the remaining images are also merged with
+    a better copy of the same picture in another resolution or encoding:
+    their dHashes must be within `threshold` bits of that copy's, confirmed
+    by a matching aspect ratio and pHash (see is_same_picture). Each image is
+    compared with the best copy of a group, never chained through other
+    members, and flat images (solid fills, plain banners) are never merged.
+    Merged variants are moved to target_dir/.merged instead of being deleted.
+
+    Hashing and size probing run on `workers` threads and are cached per file,
+    so re-running on an organized directory only lists and stats it.
+
+    Returns {"probed", "cache_hits", "kept", "duplicates_removed", "variants_moved"}.
     """
     if not os.path.isdir(target_dir):
         print(f"Error: Target directory '{target_dir}' not found.")
-        return
+        return None
 
-    temp_dir = os.path.join(target_dir, "temp_unique_assets")
-    Path(temp_dir).mkdir(parents=True, exist_ok=True)
     print(f"--- Organizing assets in '{target_dir}' ---")
+    cache = load_asset_cache(target_dir)
 
-    # Group files by hash
-    image_groups = {}
+    # Collect files to probe; the manifest and our own dotfiles are not images
+    candidates = []
+    unreadable = []
+    for entry in os.scandir(target_dir):
+        if entry.name == MANIFEST_FILENAME or entry.name.startswith('.'):
+            continue
+        if entry.is_dir():
+            unreadable.append(entry.path)
+        elif entry.is_file():
+            candidates.append((entry.name, entry.path, entry.stat()))
+
+    # Hash every image and record its quality
     print("\n--- Grouping duplicate images ---")
-    for filename in os.listdir(target_dir):
-        filepath = os.path.join(target_dir, filename)
-        if os.path.isfile(filepath) and filepath != temp_dir: # Exclude the temp directory itself
+    new_cache = {}
+    image_records = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            (name, path, executor.submit(probe_image, path, stat_result, cache.get(name), perceptual))
+            for name, path, stat_result in candidates
+        ]
+        for name, path, future in futures:
             try:
-                file_hash = get_file_hash(filepath)
-                if file_hash not in image_groups:
-                    image_groups[file_hash] = []
-                
-                with Image.open(filepath) as img:
-                    width, height = img.size
-                    file_size = os.path.getsize(filepath)
-                    image_groups[file_hash].append({
-                        "path": filepath,
-                        "size_kb": file_size / 1024,
-                        "resolution": width * height
-                    })
+                record = future.result()
             except Exception as e:
-                print(f"Could not process file {filepath}: {e}")
+                print(f"Could not process file {path}: {e}")
+                unreadable.append(path)
+                continue
+            new_cache[name] = record
+            image_records.append({
+                "path": path,
+                "hash": record["hash"],
+                "dhash": record["dhash"],
+                "phash": record["phash"],
+                "low_detail": record["low_detail"],
+                "size_kb": record["size"] / 1024,
+                "width": record["width"],
+                "height": record["height"],
+                "resolution": record["resolution"],
+            })
+    cache_hits = sum(1 for name, record in new_cache.items() if cache.get(name) is record)
+    print(f"Probed {len(image_records)} images ({cache_hits} unchanged, served from cache)")
+
+    # Group files by exact hash; the best copy of each group stays
+    groups_by_hash = {}
+    for record in image_records:
+        groups_by_hash.setdefault(record["hash"], []).append(record)
+    image_groups = [sorted(files, key=_quality, reverse=True) for files in groups_by_hash.values()]
+
+    if perceptual:
+        # Then merge the groups whose best copies show the same picture
+        print(f"Grouping by perceptual hash (Hamming distance <= {threshold})")
+        image_groups.sort(key=lambda files: _quality(files[0]), reverse=True)
+        clusters = group_near_duplicates(
+            [(None if files[0]["low_detail"] else files[0]["dhash"], files) for files in image_groups], threshold,
+            confirm=lambda files, best_files: is_same_picture(files[0], best_files[0], threshold))
+        image_groups = [[record for files in cluster for record in files] for cluster in clusters]
+        variants = {id(files[0]) for cluster in clusters for files in cluster[1:]}
+    else:
+        variants = set()
 
-    # Find the best image in each group and copy it to temp_dir
-    print("\n--- Selecting best quality image from each group and moving to temporary location ---")
+    # Keep the best image in each group; delete exact copies and move variants aside
+    print("\n--- Selecting best quality image from each group and removing the others ---")
     final_image_count = 0
-    for file_hash, files in image_groups.items():
-        if not files:
-            continue
-        
-        # Find the best quality image in the group (highest resolution, then largest size)
-        best_image = max(files, key=lambda x: (x['resolution'], x['size_kb']))
-        
-        source_path = best_image['path']
-        destination_path = os.path.join(temp_dir, os.path.basename(source_path))
-        
-        try:
-            shutil.copy2(source_path, destination_path)
-            print(f"Copied best version: {os.path.basename(destination_path)}")
-            final_image_count += 1
-        except shutil.Error as e:
-            print(f"Error copying file {os.path.basename(source_path)} to temp: {e}")
-
-    # Clear the original target directory
-    print("\n--- Clearing original assets directory ---")
-    for filename in os.listdir(target_dir):
-        filepath = os.path.join(target_dir, filename)
-        if os.path.isfile(filepath):
-            os.remove(filepath)
-        elif os.path.isdir(filepath) and filepath != temp_dir: # Remove other subdirectories if any, but not temp_dir
-            shutil.rmtree(filepath)
-
-    # Move unique, high-quality images back to the target directory
-    print("\n--- Moving unique assets back to original directory ---")
-    for filename in os.listdir(temp_dir):
-        filepath = os.path.join(temp_dir, filename)
-        shutil.move(filepath, target_dir)
-
-    # Remove the temporary directory
-    shutil.rmtree(temp_dir)
+    replaced = {}
+    moved = {}
+    for files in image_groups:
+        best_image = files[0]
+        final_image_count += 1
+        for other in files[1:]:
+            other_name = os.path.basename(other['path'])
+            try:
+                if id(other) in variants:
+                    moved[other_name] = move_aside(other['path'], target_dir)
+                else:
+                    os.remove(other['path'])
+            except OSError as e:
+                print(f"Error removing duplicate {other_name}: {e}")
+                continue
+            new_cache.pop(other_name, None)
+            replaced[other_name] = os.path.basename(best_image['path'])
+            if other_name in moved:
+                print(f"Moved {other_name} to {moved[other_name]} (near-duplicate of {replaced[other_name]})")
+            else:
+                print(f"Removed {other_name} (kept {replaced[other_name]})")
+
+    # Files that are not images (and stray subdirectories) are removed, as before
+    for path in unreadable:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+    merge_manifest_sources(target_dir, replaced, moved)
+    if new_cache != cache:
+        write_json_atomic(os.path.join(target_dir, CACHE_FILENAME), new_cache)
 
     print(f"\n--- Task Complete ---")
-    print(f"A total of {final_image_count} unique, high-quality images have been organized in '{target_dir}'.")
+    print(f"A total of {final_image_count} unique, high-quality images have been organized in '{target_dir}' "
+          f"({len(replaced) - len(moved)} duplicates removed, {len(moved)} near-duplicates moved to "
+          f"'{os.path.join(target_dir, MERGED_DIRNAME)}').")
+    return {"probed": len(image_records), "cache_hits": cache_hits, "kept": final_image_count,
+            "duplicates_removed": len(replaced) - len(moved), "variants_moved": len(moved)}
 
 if __name__ == "__main__":
-    source_directory = "assets"
-    destination_directory = "assets"
-    organize_and_copy_assets(source_directory, destination_directory)
+    parser = argparse.ArgumentParser(description="Remove duplicate images, keeping the best quality copy.")
+    parser.add_argument("target_dir", nargs="?", default="assets")
+    parser.add_argument("--perceptual", action="store_true",
+                        help="Also merge near-duplicates (resized/re-encoded copies) using perceptual hashes; they are moved to .merged/.")
+    parser.add_argument("--threshold", type=int, default=DEFAULT_HAMMING_THRESHOLD,
+                        help="Max dHash Hamming distance for --perceptual (0-64).")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Threads used for hashing and image probing (default: Python's default pool size).")
+    args = parser.parse_args()
+    organize_and_copy_assets(args.target_dir, args.perceptual, args.threshold, args.workers)
@@ -0,0 +1,234 @@
+import json
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from response_cache import ResponseCache
+
+# Sections of the generated CompanyProfile, in document order
+PROFILE_SECTIONS = (
+    ("CompanyDetails", "Basic information like name, tenure, mission, contact info."),
+    ("BrandIdentity", "Core branding elements, including brand names used and brand voice."),
+    ("ProductsAndServices", "Detailed breakdown of products, services, features, and categories."),
+    ("TargetAudience", "Description of the ideal customers."),
+    ("MarketPositioning", "Analysis of the company's position in the market, its strengths, and unique selling propositions."),
+    ("WebsiteFoundation", "Strategic recommendations for the website, including key sections, features, and calls-to-action."),
+    ("ProfileValuation", "An evaluation of the generated profile's completeness and utility for website development."),
+)
+
+# Files the pipeline writes itself; they are results, not inputs to the profile
+GENERATED_OUTPUTS = frozenset({
+    "company_profile.xml", "posts.json", "messages.jsonl", "manifest.json", "run_report.json", "batch_summary.json",
+    "run.log",
+})
+# cProfile dumps (see run_report), interrupted atomic writes and the search index (see search_index)
+GENERATED_SUFFIXES = (".prof", ".tmp", ".sqlite3", ".sqlite3-wal", ".sqlite3-shm")
+HISTORY_FILENAME = "history.json"
+
+# Budgets are in estimated tokens (see estimate_tokens)
+DEFAULT_TOKEN_BUDGET = 100_000
+DEFAULT_HISTORY_CHUNK_TOKENS = 8_000
+DEFAULT_SUMMARY_WORKERS = 4
+# Rounds of summarizing the summaries before giving up and truncating
+MAX_REDUCE_ROUNDS = 3
+# Example file names shown per asset group
+ASSET_SAMPLE_SIZE = 3
+
+SUMMARY_INSTRUCTIONS = (
+    "Below is a batch of social media posts from a company's Facebook page. Summarize them in at most "
+    "15 short bullet points for someone writing a company profile: products and services (with sizes, "
+    "models and prices when given), brand names, locations and customers served, recurring themes and "
+    "hashtags, and the tone of voice. Do not invent anything that is not in the posts."
+)
+
+def estimate_tokens(text):
+    """
+    Rough token count without a tokenizer: about 4 bytes of UTF-8 per token,
+    which also gives CJK text (3 bytes per character) a realistic weight.
+    """
+    return len(text.encode('utf-8')) // 4 + 1
+
+def compose_prompt(context, sections=PROFILE_SECTIONS):
+    """Wraps the data context in the profile instructions for the given sections."""
+    prompt_parts = [
+        "You are an expert business consultant and web developer. Your task is to generate a detailed company profile in XML format. This profile will serve as the foundation for building a new website for the company.",
+        "Analyze the provided data, which includes social media history, company introduction, and a list of asset files (images). From this data, create a comprehensive company profile.",
+        "The XML output should be well-structured and include the following sections:",
+    ]
+    for number, (name, description) in enumerate(sections, 1):
+        prompt_parts.append(f"{number}. **{name}**: {description}")
+    prompt_parts.append("\nHere is the data:\n")
+    prompt_parts.append(context)
+    return "\n".join(prompt_parts)
+
+def compress_asset_list(asset_paths):
+    """
+    Summarizes asset paths as one line per directory and extension (count, total
+    size and a few example names) instead of one line per file.
+    """
+    groups = defaultdict(list)
+    for path, size in asset_paths:
+        directory, filename = os.path.split(path)
+        extension = os.path.splitext(filename)[1].lower() or "(none)"
+        groups[(directory, extension)].append((filename, size))
+
+    lines = []
+    for (directory, extension), files in sorted(groups.items()):
+        files.sort()
+        examples = ", ".join(name for name, _ in files[:ASSET_SAMPLE_SIZE])
+        more = ", ..." if len(files) > ASSET_SAMPLE_SIZE else ""
+        total_kb = sum(size for _, size in files) / 1024
+        lines.append(f"- {directory}/ {len(files)} {extension} files, {total_kb:.0f} KB (e.g. {examples}{more})")
+    return "\n".join(lines)
+
+def _list_files(directory):
+    """Yields (path, size) for non-hidden files under directory, skipping the pipeline's own outputs."""
+    if not os.path.isdir(directory):
+        print(f"Warning: Directory not found: {directory}")
+        return
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for file in sorted(files):
+            if file.startswith('.') or file in GENERATED_OUTPUTS or file.endswith(GENERATED_SUFFIXES):
+                continue
+            path = os.path.join(root, file)
+            yield path, os.path.getsize(path)
+
+def chunk_texts(texts, chunk_tokens):
+    """Splits texts into consecutive chunks of at most chunk_tokens estimated tokens (at least one text each)."""
+    chunks = []
+    current, current_tokens = [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and current_tokens + tokens > chunk_tokens:
+            chunks.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+class HistorySummarizer:
+    """
+    Map-reduce summarization of a long post history: chunks are summarized
+    concurrently through the model client, and the summaries are summarized
+    again until they fit the budget. Summaries go through the response cache,
+    so unchanged chunks are not sent twice.
+    """
+
+    def __init__(self, model_client, chunk_tokens=DEFAULT_HISTORY_CHUNK_TOKENS,
+                 workers=DEFAULT_SUMMARY_WORKERS, cache=None):
+        self.model_client = model_client
+        self.chunk_tokens = chunk_tokens
+        self.workers = workers
+        self.cache = cache
+        self.calls = 0
+        self.cache_hits = 0
+
+    def _summarize_chunk(self, texts):
+        prompt = SUMMARY_INSTRUCTIONS + "\n\n" + "\n".join(f"- {text}" for text in texts)
+        key = ResponseCache.make_key(self.model_client.name, prompt)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cache_hits += 1
+                return cached
+        summary = self.model_client.generate(prompt).strip()
+        self.calls += 1
+        if self.cache is not None:
+            self.cache.put(key, summary, self.model_client.name)
+        return summary
+
+    def summarize(self, texts, token_budget):
+        """Returns a list of summaries that together fit token_budget (truncated if the reduce rounds run out)."""
+        for round_number in range(1, MAX_REDUCE_ROUNDS + 1):
+            chunks = chunk_texts(texts, self.chunk_tokens)
+            print(f"Summarizing {len(texts)} texts in {len(chunks)} chunks (round {round_number}, {self.workers} workers)...")
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                texts = list(executor.map(self._summarize_chunk, chunks))
+            if sum(estimate_tokens(text) for text in texts) <= token_budget or len(texts) == 1:
+                break
+        return _truncate_to_budget(texts, token_budget)
+
+def _truncate_to_budget(texts, token_budget):
+    kept, used = [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if used + tokens > token_budget:
+            print(f"Warning: dropped {len(texts) - len(kept)} of {len(texts)} history items to stay within the token budget.")
+            break
+        kept.append(text)
+        used += tokens
+    return kept
+
+def _load_history(path):
+    """Returns the unique post texts in history.json, in order (reposts and re-captures appear many times)."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            texts = json.load(f)
+    except (IOError, ValueError) as e:
+        print(f"Warning: could not read {path}: {e}")
+        return []
+    if not isinstance(texts, list):
+        return []
+    return list(dict.fromkeys(text for text in texts if isinstance(text, str) and text.strip()))
+
+def build_profile_context(out_dir, assets_dir, root_dir, model_client=None, token_budget=DEFAULT_TOKEN_BUDGET,
+                          chunk_tokens=DEFAULT_HISTORY_CHUNK_TOKENS, summary_workers=DEFAULT_SUMMARY_WORKERS,
+                          cache=None, instructions_tokens=0):
+    """
+    Builds the data part of the profile prompt within token_budget: text files
+    from out_dir verbatim (minus generated outputs and binaries), a compressed
+    asset listing, and history.json either verbatim or, when it does not fit,
+    as map-reduce summaries produced through model_client.
+
+    Returns (context, stats) where stats reports estimated tokens per part.
+    """
+    parts = []
+    stats = Counter()
+    history_path = None
+
+    for path, _ in _list_files(out_dir):
+        label = os.path.relpath(path, root_dir)
+        if os.path.basename(path) == HISTORY_FILENAME:
+            history_path = path
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except (UnicodeDecodeError, IOError):
+            stats["skipped_files"] += 1  # Binary files carry nothing the model can use
+            continue
+        parts.append(f"--- Content from {label} ---\n{content}\n")
+        stats["files_tokens"] += estimate_tokens(parts[-1])
+
+    asset_paths = [(os.path.relpath(path, root_dir), size) for path, size in _list_files(assets_dir)]
+    asset_part = f"--- Asset Files (Mainly Images): {len(asset_paths)} files ---\n{compress_asset_list(asset_paths)}\n"
+    stats["assets_tokens"] = estimate_tokens(asset_part)
+
+    if history_path is not None:
+        label = os.path.relpath(history_path, root_dir)
+        texts = _load_history(history_path)
+        history_budget = token_budget - instructions_tokens - stats["files_tokens"] - stats["assets_tokens"]
+        verbatim = json.dumps(texts, ensure_ascii=False, indent=1)
+        if estimate_tokens(verbatim) <= history_budget:
+            parts.append(f"--- Content from {label} ({len(texts)} unique posts) ---\n{verbatim}\n")
+        elif model_client is None or history_budget <= 0:
+            texts = _truncate_to_budget(texts, max(history_budget, 0))
+            parts.append(f"--- Content from {label} (first {len(texts)} unique posts) ---\n"
+                         f"{json.dumps(texts, ensure_ascii=False, indent=1)}\n")
+        else:
+            summarizer = HistorySummarizer(model_client, chunk_tokens, summary_workers, cache)
+            summaries = summarizer.summarize(texts, history_budget)
+            stats["summary_calls"] = summarizer.calls
+            stats["summary_cache_hits"] = summarizer.cache_hits
+            parts.append(f"--- Summary of {label} ({len(texts)} unique posts, {len(summaries)} parts) ---\n"
+                         + "\n\n".join(summaries) + "\n")
+        stats["history_tokens"] = estimate_tokens(parts[-1])
+
+    parts.append(asset_part)
+    context = "\n".join(parts)
+    stats["total_tokens"] = instructions_tokens + estimate_tokens(context)
+    stats["token_budget"] = token_budget
+    return context, dict(stats)
@@ -0,0 +1,128 @@
+import asyncio
+import random
+import time
+import xml.etree.ElementTree as ET
+
+from model_output import strip_code_fences
+from profile_prompt import PROFILE_SECTIONS, compose_prompt
+from response_cache import ResponseCache
+
+PROFILE_ROOT_TAG = "CompanyProfile"
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RETRIES = 3
+# First retry waits about this long, doubling each attempt (plus jitter)
+DEFAULT_BACKOFF_SECONDS = 1.0
+
+class SectionGenerationError(Exception):
+    """A profile section could not be generated or parsed after all retries."""
+
+def section_prompt(context, name, description):
+    """The profile prompt narrowed to one section, asking for just that element."""
+    return (compose_prompt(context, sections=((name, description),))
+            + f"\n\nReturn only the <{name}> element, with no XML declaration, "
+              f"no <{PROFILE_ROOT_TAG}> wrapper and no commentary.")
+
+def _parse_response(text, name):
+    """Parses the XML in a model response (fences and declaration allowed); ValueError if there is none."""
+    body = strip_code_fences(text).strip()
+    if body.startswith("<?xml"):
+        body = body.split("?>", 1)[1].strip()
+    if not body:
+        raise ValueError(f"empty response for {name}")
+    try:
+        return ET.fromstring(body)
+    except ET.ParseError as e:
+        raise ValueError(f"malformed XML for {name}: {e}")
+
+def parse_profile(text):
+    """
+    Parses a whole-profile response into its <CompanyProfile> element.
+    Raises ValueError if it is empty, malformed (e.g. cut off) or has another root.
+    """
+    element = _parse_response(text, PROFILE_ROOT_TAG)
+    if element.tag != PROFILE_ROOT_TAG:
+        raise ValueError(f"expected <{PROFILE_ROOT_TAG}>, got <{element.tag}>")
+    return element
+
+def parse_section(text, name):
+    """
+    Parses a model response into the <name> element. A response holding a whole
+    CompanyProfile is accepted too, taking the section out of it.
+    Raises ValueError if the XML is malformed or the section is missing.
+    """
+    element = _parse_response(text, name)
+    if element.tag == name:
+        return element
+    found = element.find(name) if element.tag == PROFILE_ROOT_TAG else None
+    if found is None:
+        raise ValueError(f"expected <{name}>, got <{element.tag}>")
+    return found
+
+def merge_sections(elements):
+    """Assembles section elements (in PROFILE_SECTIONS order) into the CompanyProfile document text."""
+    root = ET.Element(PROFILE_ROOT_TAG)
+    for element in elements:
+        root.append(element)
+    ET.indent(root, space="    ")
+    xml_text = '<?xml version="1.0" encoding="UTF-8"?>\n' + ET.tostring(root, encoding="unicode") + "\n"
+    ET.fromstring(xml_text.split("?>", 1)[1])  # The merged document must parse on its own
+    return xml_text
+
+class SectionGenerator:
+    """
+    Requests the profile sections concurrently, at most `concurrency` at a time.
+    Blocking model clients run in worker threads (asyncio.to_thread). A failed
+    call or an unparsable section is retried with exponential backoff and jitter.
+    Parsed section responses go through the response cache, if one is given.
+    """
+
+    def __init__(self, model_client, concurrency=DEFAULT_CONCURRENCY, retries=DEFAULT_RETRIES,
+                 backoff_seconds=DEFAULT_BACKOFF_SECONDS, cache=None):
+        self.model_client = model_client
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.cache = cache
+        self.timings = {}
+
+    async def _generate_section(self, semaphore, context, name, description):
+        prompt = section_prompt(context, name, description)
+        cache_key = ResponseCache.make_key(self.model_client.name, prompt)
+        if self.cache is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                try:
+                    element = parse_section(cached, name)
+                except ValueError:
+                    pass  # Stored by an older version without this check; generate it again
+                else:
+                    self.timings[name] = 0.0
+                    return element
+
+        for attempt in range(self.retries + 1):
+            async with semaphore:
+                start_time = time.perf_counter()
+                try:
+                    text = await asyncio.to_thread(self.model_client.generate, prompt)
+                    element = parse_section(text, name)
+                except Exception as e:
+                    error = e
+                else:
+                    self.timings[name] = time.perf_counter() - start_time
+                    if self.cache is not None:
+                        self.cache.put(cache_key, text, self.model_client.name)
+                    return element
+            if attempt < self.retries:
+                delay = self.backoff_seconds * 2 ** attempt * (1 + random.random())
+                print(f"Section {name} failed ({error}); retrying in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+        raise SectionGenerationError(f"Section {name} failed after {self.retries + 1} attempts: {error}")
+
+    async def _generate_all(self, context, sections):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*(
+            self._generate_section(semaphore, context, name, description) for name, description in sections))
+
+    def generate(self, context, sections=PROFILE_SECTIONS):
+        """Generates every section and returns the merged CompanyProfile XML text."""
+        return merge_sections(asyncio.run(self._generate_all(context, sections)))
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+import time
+
+# Defaults: a few dozen profiles, and nothing older than 30 days
+DEFAULT_MAX_ENTRIES = 64
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_MAX_AGE_SECONDS = 30 * 24 * 3600
+
+class ResponseCache:
+    """
+    On-disk cache of model responses, one JSON file per key.
+
+    Keys hash the model name and the full prompt, so any change to the inputs
+    misses. A file's mtime is its last use; eviction drops expired entries
+    first, then the least recently used until the count and size limits hold.
+    """
+
+    def __init__(self, cache_dir, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES,
+                 max_age_seconds=DEFAULT_MAX_AGE_SECONDS):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+
+    @staticmethod
+    def make_key(model_name, prompt):
+        digest = hashlib.sha256()
+        digest.update(model_name.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(prompt.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """Returns the cached response text, or None on a miss or an expired entry."""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if time.time() - entry.get("created", 0) > self.max_age_seconds:
+            os.remove(path)
+            return None
+        os.utime(path)  # Mark as recently used
+        return entry.get("text")
+
+    def put(self, key, text, model_name=""):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"model": model_name, "created": time.time(), "text": text}, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Removes expired entries, then least recently used ones beyond the size/count limits."""
+        if not os.path.isdir(self.cache_dir):
+            return
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            stat_result = entry.stat()
+            # mtime is refreshed on every hit, so this only catches entries nobody has used lately
+            if now - stat_result.st_mtime > self.max_age_seconds:
+                os.remove(entry.path)
+                continue
+            entries.append((stat_result.st_mtime, stat_result.st_size, entry.path))
+
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_entries or total_bytes > self.max_bytes):
+            _, size, path = entries.pop(0)
+            os.remove(path)
+            total_bytes -= size
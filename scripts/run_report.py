@@ -0,0 +1,141 @@
+import contextlib
+import cProfile
+import datetime
+import json
+import os
+import pstats
+import resource
+import sys
+import time
+
+from model_output import write_text_atomic
+
+RUN_REPORT_FILENAME = "run_report.json"
+# Lines of the cProfile summary (by cumulative time) kept in the report
+PROFILE_TOP_FUNCTIONS = 15
+
+def _read_proc_io():
+    """Returns this process's /proc/self/io counters, or {} where that is not available (non-Linux)."""
+    try:
+        with open("/proc/self/io") as f:
+            return {key: int(value) for key, value in (line.split(": ") for line in f)}
+    except (OSError, ValueError):
+        return {}
+
+def _reset_peak_rss():
+    """Resets the kernel's peak-RSS mark (VmHWM) so it covers only what follows. False if unsupported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def _peak_rss_mb():
+    """Peak RSS of this process in MB: VmHWM on Linux, else ru_maxrss (KB on Linux, bytes on macOS)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+class RunReport:
+    """
+    Collects per-stage measurements for one run and writes them as JSON.
+
+    Each `with report.stage(name) as counters:` block records wall and CPU time
+    (worker processes included), peak RSS during the stage, bytes read and
+    written by this process (/proc/self/io rchar/wchar, so pipes to worker
+    processes count too, plus actual storage I/O), and whatever counters the block
+    puts into `counters`. Reads of a memory-mapped file are page faults and
+    count in neither, so extraction stages add their own har_bytes_scanned. A stage that imports its modules when it starts
+    stores that cold-start time as counters["import_seconds"], shown in its
+    own column by print_summary. One stage can be run under cProfile; its
+    stats are dumped to output_dir next to the report and summarized in it.
+    """
+
+    def __init__(self, output_dir, profile_stage=None):
+        self.output_dir = output_dir
+        self.profile_stage = profile_stage
+        self.started = time.perf_counter()
+        self.created = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+        self.stages = []
+        self.info = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        counters = {}
+        record = {"stage": name}
+        per_stage_peak = _reset_peak_rss()
+        io_before = _read_proc_io()
+        times_before = os.times()
+        started = time.perf_counter()
+        profiler = cProfile.Profile() if name == self.profile_stage else None
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield counters
+            record["status"] = "ok"
+        except BaseException as e:
+            record["status"] = "error"
+            record["error"] = str(e) or type(e).__name__
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            times_after = os.times()
+            io_after = _read_proc_io()
+            record["wall_seconds"] = round(time.perf_counter() - started, 4)
+            record["cpu_seconds"] = round((times_after.user + times_after.system)
+                                          - (times_before.user + times_before.system), 4)
+            record["child_cpu_seconds"] = round((times_after.children_user + times_after.children_system)
+                                                - (times_before.children_user + times_before.children_system), 4)
+            # Without a reset the mark is the process peak so far, which is still an upper bound
+            record["peak_rss_mb"] = round(_peak_rss_mb(), 1)
+            record["peak_rss_scope"] = "stage" if per_stage_peak else "process"
+            for key, label in (("rchar", "bytes_read"), ("wchar", "bytes_written"),
+                               ("read_bytes", "storage_bytes_read"), ("write_bytes", "storage_bytes_written")):
+                if key in io_before and key in io_after:
+                    record[label] = io_after[key] - io_before[key]
+            record["counters"] = counters
+            if profiler is not None:
+                record["profile"] = self._save_profile(name, profiler)
+            self.stages.append(record)
+
+    def _save_profile(self, name, profiler):
+        path = os.path.join(self.output_dir, f"profile_{name}.prof")
+        profiler.dump_stats(path)
+        summary = {"stats_file": path}
+        stats = pstats.Stats(profiler)
+        top = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP_FUNCTIONS]
+        summary["top_cumulative"] = [
+            {"function": f"{os.path.basename(filename)}:{line}({function})", "calls": calls,
+             "total_seconds": round(total_time, 4), "cumulative_seconds": round(cumulative_time, 4)}
+            for (filename, line, function), (_, calls, total_time, cumulative_time, _) in top
+        ]
+        return summary
+
+    def as_dict(self):
+        return {
+            "created": self.created,
+            "python": sys.version.split()[0],
+            "total_wall_seconds": round(time.perf_counter() - self.started, 4),
+            **self.info,
+            "stages": self.stages,
+        }
+
+    def write(self):
+        path = os.path.join(self.output_dir, RUN_REPORT_FILENAME)
+        write_text_atomic(path, json.dumps(self.as_dict(), ensure_ascii=False, indent=4) + "\n")
+        return path
+
+    def print_summary(self):
+        print(f"{'stage':<20}{'wall s':>9}{'import s':>10}{'cpu s':>9}{'peak MB':>10}{'read MB':>10}{'written MB':>12}")
+        for record in self.stages:
+            print(f"{record['stage']:<20}{record['wall_seconds']:>9.2f}{record['counters'].get('import_seconds', 0):>10.2f}"
+                  f"{record['cpu_seconds'] + record['child_cpu_seconds']:>9.2f}{record['peak_rss_mb']:>10.1f}"
+                  f"{record.get('bytes_read', 0) / 1048576:>10.1f}{record.get('bytes_written', 0) / 1048576:>12.1f}")
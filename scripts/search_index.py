@@ -0,0 +1,375 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+from extract_images import MANIFEST_FILENAME
+from message_writer import MESSAGES_FILENAME, message_key
+
+SEARCH_DB_FILENAME = "search.sqlite3"
+DEFAULT_RESULT_LIMIT = 20
+# Rows per executemany while loading messages.jsonl
+INSERT_BATCH_SIZE = 5000
+# Bytes hashed at each end of the indexed part of messages.jsonl (see _fingerprint)
+FINGERPRINT_BLOCK_SIZE = 64 * 1024
+
+HASHTAG_PATTERN = re.compile(r'#(\w+)')
+
+# posts_fts is an external-content FTS5 table over posts.text, kept in sync
+# by triggers; unicode61 with remove_diacritics folds case and accents.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    page_id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE,
+    messages_path TEXT,
+    messages_inode INTEGER,
+    messages_size INTEGER,
+    messages_mtime_ns INTEGER,
+    messages_fingerprint TEXT,
+    manifest_path TEXT,
+    manifest_size INTEGER,
+    manifest_mtime_ns INTEGER,
+    updated REAL
+);
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    page_id INTEGER NOT NULL,
+    message_key BLOB NOT NULL,
+    post_id TEXT,
+    timestamp INTEGER,
+    text TEXT NOT NULL,
+    UNIQUE (page_id, message_key)
+);
+CREATE TABLE IF NOT EXISTS hashtags (
+    post_rowid INTEGER NOT NULL,
+    tag TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS hashtags_tag ON hashtags (tag);
+CREATE INDEX IF NOT EXISTS hashtags_post ON hashtags (post_rowid);
+CREATE TABLE IF NOT EXISTS post_media (
+    post_rowid INTEGER NOT NULL,
+    url TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS post_media_post ON post_media (post_rowid);
+CREATE INDEX IF NOT EXISTS post_media_url ON post_media (url);
+CREATE TABLE IF NOT EXISTS assets (
+    page_id INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    sha256 TEXT,
+    url TEXT
+);
+CREATE INDEX IF NOT EXISTS assets_url ON assets (url);
+CREATE INDEX IF NOT EXISTS assets_page ON assets (page_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+    text, content='posts', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS posts_ai AFTER INSERT ON posts BEGIN
+    INSERT INTO posts_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS posts_ad AFTER DELETE ON posts BEGIN
+    INSERT INTO posts_fts (posts_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+# Columns added to pages after the first release, for databases created before them
+_ADDED_PAGE_COLUMNS = (("messages_mtime_ns", "INTEGER"), ("messages_fingerprint", "TEXT"))
+
+def _fingerprint(f, size):
+    """
+    Hash of the first `size` bytes of file f, sampled: its first and last
+    FINGERPRINT_BLOCK_SIZE bytes (so the last indexed lines) and the size.
+    Cheap enough to check on every update, however long the file.
+    """
+    digest = hashlib.blake2b(str(size).encode('ascii'), digest_size=16)
+    f.seek(0)
+    digest.update(f.read(min(size, FINGERPRINT_BLOCK_SIZE)))
+    tail_start = max(size - FINGERPRINT_BLOCK_SIZE, FINGERPRINT_BLOCK_SIZE)
+    if tail_start < size:
+        f.seek(tail_start)
+        digest.update(f.read(size - tail_start))
+    return digest.hexdigest()
+
+def extract_hashtags(text):
+    """Lower-cased hashtags in text, without the '#', in order of first appearance."""
+    return list(dict.fromkeys(tag.lower() for tag in HASHTAG_PATTERN.findall(text)))
+
+def quote_query(query):
+    """Turns free text into an FTS5 query matching all of its words, so user input never hits FTS5 syntax."""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+class SearchIndex:
+    """
+    SQLite FTS5 index of extracted posts, their hashtags and the assets they
+    link to, across any number of scraped pages.
+
+    Updates are incremental: a page's messages.jsonl that only grew since the
+    last update (incremental runs append to it) is read from where the last
+    update stopped; a rewritten file replaces the page's posts; unchanged
+    files are not read at all. "Only grew" means same inode, no smaller, and
+    the part indexed before still has the same fingerprint: a rewrite can get
+    a freed inode back, and a same-size rewrite is told apart by its mtime. The asset list is reloaded when manifest.json
+    changes.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(pages)")}
+        for column, column_type in _ADDED_PAGE_COLUMNS:
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE pages ADD COLUMN {column} {column_type}")
+
+    def _page(self, name):
+        row = self._conn.execute(
+            "SELECT page_id, messages_inode, messages_size, messages_mtime_ns, messages_fingerprint, manifest_size, "
+            "manifest_mtime_ns FROM pages WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            page_id = self._conn.execute("INSERT INTO pages (name) VALUES (?)", (name,)).lastrowid
+            return page_id, None, 0, None, None, None, None
+        return row
+
+    def _delete_posts(self, page_id):
+        self._conn.execute("DELETE FROM hashtags WHERE post_rowid IN (SELECT id FROM posts WHERE page_id = ?)",
+                           (page_id,))
+        self._conn.execute("DELETE FROM post_media WHERE post_rowid IN (SELECT id FROM posts WHERE page_id = ?)",
+                           (page_id,))
+        self._conn.execute("DELETE FROM posts WHERE page_id = ?", (page_id,))
+
+    def _existing_keys(self, page_id, keys):
+        existing = set()
+        keys = list(keys)
+        # Stays under SQLite's default limit of 999 parameters per statement
+        for offset in range(0, len(keys), 900):
+            chunk = keys[offset:offset + 900]
+            existing.update(key for (key,) in self._conn.execute(
+                f"SELECT message_key FROM posts WHERE page_id = ? AND message_key IN ({','.join('?' * len(chunk))})",
+                [page_id] + chunk))
+        return existing
+
+    def _insert_posts(self, page_id, records):
+        """Inserts the records that are not indexed yet, in bulk; returns how many were added."""
+        keyed = {}
+        for record in records:
+            text = record.get("text")
+            if isinstance(text, str) and text.strip():
+                keyed.setdefault(message_key(record), record)
+        for key in self._existing_keys(page_id, keyed):
+            del keyed[key]
+        if not keyed:
+            return 0
+
+        # Row ids are assigned here so hashtags and media can be inserted with executemany too
+        next_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM posts").fetchone()[0]
+        posts, hashtags, media = [], [], []
+        for rowid, (key, record) in enumerate(keyed.items(), next_id):
+            posts.append((rowid, page_id, key, record.get("post_id"), record.get("timestamp"), record["text"]))
+            hashtags.extend((rowid, tag) for tag in extract_hashtags(record["text"]))
+            media.extend((rowid, url) for url in record.get("media") or [] if isinstance(url, str))
+        self._conn.executemany(
+            "INSERT INTO posts (id, page_id, message_key, post_id, timestamp, text) VALUES (?, ?, ?, ?, ?, ?)", posts)
+        self._conn.executemany("INSERT INTO hashtags (post_rowid, tag) VALUES (?, ?)", hashtags)
+        self._conn.executemany("INSERT INTO post_media (post_rowid, url) VALUES (?, ?)", media)
+        return len(posts)
+
+    def _update_messages(self, page_id, messages_path, known):
+        """
+        Loads new lines of messages.jsonl; returns the number of posts added.
+        `known` is the file's (inode, size, mtime_ns, fingerprint) as of the last update.
+        """
+        known_inode, known_size, known_mtime_ns, known_fingerprint = known
+        try:
+            f = open(messages_path, 'rb')
+        except FileNotFoundError:
+            return 0
+        with f:
+            # Of the file actually opened, in case it is being replaced right now
+            stat = os.fstat(f.fileno())
+            if (stat.st_ino, stat.st_size, stat.st_mtime_ns) == (known_inode, known_size, known_mtime_ns):
+                return 0
+            if (stat.st_ino == known_inode and stat.st_size >= known_size
+                    and _fingerprint(f, known_size) == known_fingerprint):
+                start = known_size  # Appended to since the last update
+            else:
+                start = 0
+                self._delete_posts(page_id)
+
+            added = 0
+            f.seek(start)
+            batch = []
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # A line still being written; picked up next time
+                start += len(line)
+                if line.strip():
+                    batch.append(json.loads(line))
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    added += self._insert_posts(page_id, batch)
+                    batch = []
+            added += self._insert_posts(page_id, batch)
+            fingerprint = _fingerprint(f, start)
+        self._conn.execute(
+            "UPDATE pages SET messages_path = ?, messages_inode = ?, messages_size = ?, messages_mtime_ns = ?, "
+            "messages_fingerprint = ? WHERE page_id = ?",
+            (messages_path, stat.st_ino, start, stat.st_mtime_ns, fingerprint, page_id))
+        return added
+
+    def _update_assets(self, page_id, manifest_path, known_size, known_mtime_ns):
+        """Reloads the page's assets from manifest.json if it changed; returns the number of asset rows."""
+        try:
+            stat = os.stat(manifest_path)
+        except FileNotFoundError:
+            return 0
+        if stat.st_size == known_size and stat.st_mtime_ns == known_mtime_ns:
+            return 0
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                images = json.load(f).get("images", {})
+        except (IOError, ValueError) as e:
+            print(f"Warning: could not read {manifest_path}: {e}")
+            return 0
+        rows = []
+        for filename, record in images.items():
+            for source in record.get("sources", []):
+                rows.append((page_id, filename, record.get("sha256"), source.get("url")))
+        self._conn.execute("DELETE FROM assets WHERE page_id = ?", (page_id,))
+        self._conn.executemany("INSERT INTO assets (page_id, filename, sha256, url) VALUES (?, ?, ?, ?)", rows)
+        self._conn.execute("UPDATE pages SET manifest_path = ?, manifest_size = ?, manifest_mtime_ns = ? WHERE page_id = ?",
+                           (manifest_path, stat.st_size, stat.st_mtime_ns, page_id))
+        return len(rows)
+
+    def update_page(self, name, out_dir, assets_dir=None):
+        """
+        Brings one page up to date from out_dir/messages.jsonl and, if given,
+        assets_dir/manifest.json. Returns {"posts_added", "asset_rows"}.
+        """
+        page_id, inode, size, mtime_ns, fingerprint, manifest_size, manifest_mtime_ns = self._page(name)
+        with self._conn:
+            counts = {"posts_added": self._update_messages(page_id, os.path.join(out_dir, MESSAGES_FILENAME),
+                                                           (inode, size, mtime_ns, fingerprint))}
+            if assets_dir is not None:
+                counts["asset_rows"] = self._update_assets(page_id, os.path.join(assets_dir, MANIFEST_FILENAME),
+                                                           manifest_size, manifest_mtime_ns)
+            self._conn.execute("UPDATE pages SET updated = ? WHERE page_id = ?", (time.time(), page_id))
+        return counts
+
+    def search(self, query, limit=DEFAULT_RESULT_LIMIT, page=None, tag=None, raw=False):
+        """
+        Returns the best matching posts for query (all words must match, in
+        any order; with raw=True it is FTS5 query syntax), optionally limited
+        to one page and/or hashtag. An empty query lists posts with the tag.
+        Each result is a dict with page, post_id, timestamp, text, snippet,
+        hashtags and the local asset files of its linked media.
+        """
+        conditions, params = [], []
+        if query.strip():
+            match = query if raw else quote_query(query)
+            sql = ("SELECT posts.id, posts.page_id, pages.name, posts.post_id, posts.timestamp, posts.text, "
+                   "snippet(posts_fts, 0, '[', ']', '...', 16) "
+                   "FROM posts_fts JOIN posts ON posts.id = posts_fts.rowid JOIN pages USING (page_id) "
+                   "WHERE posts_fts MATCH ?")
+            params.append(match)
+            order = "ORDER BY posts_fts.rank"
+        else:
+            sql = ("SELECT posts.id, posts.page_id, pages.name, posts.post_id, posts.timestamp, posts.text, NULL "
+                   "FROM posts JOIN pages USING (page_id) WHERE 1")
+            order = "ORDER BY posts.timestamp DESC"
+        if page is not None:
+            conditions.append("pages.name = ?")
+            params.append(page)
+        if tag is not None:
+            conditions.append("posts.id IN (SELECT post_rowid FROM hashtags WHERE tag = ?)")
+            params.append(tag.lstrip('#').lower())
+        for condition in conditions:
+            sql += f" AND {condition}"
+        rows = self._conn.execute(f"{sql} {order} LIMIT ?", params + [limit]).fetchall()
+        return [self._result(*row) for row in rows]
+
+    def _result(self, rowid, page_id, page, post_id, timestamp, text, snippet):
+        hashtags = [tag for (tag,) in self._conn.execute(
+            "SELECT tag FROM hashtags WHERE post_rowid = ?", (rowid,))]
+        assets = [filename for (filename,) in self._conn.execute(
+            "SELECT DISTINCT assets.filename FROM post_media "
+            "JOIN assets ON assets.url = post_media.url AND assets.page_id = ? "
+            "WHERE post_media.post_rowid = ?", (page_id, rowid))]
+        return {"page": page, "post_id": post_id, "timestamp": timestamp, "text": text,
+                "snippet": snippet or text, "hashtags": hashtags, "assets": assets}
+
+    def counts(self):
+        return {
+            table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("pages", "posts", "hashtags", "assets")
+        }
+
+    def close(self):
+        self._conn.close()
+
+def find_page_dirs(root):
+    """
+    Pages under a run_all output root: (name, out_dir, assets_dir) for root
+    itself if it has out/ (a single run), else for every root/<page>/out (a batch).
+    """
+    if os.path.isfile(os.path.join(root, "out", MESSAGES_FILENAME)):
+        return [(os.path.basename(os.path.abspath(root)), os.path.join(root, "out"), os.path.join(root, "assets"))]
+    pages = []
+    for name in sorted(os.listdir(root)):
+        out_dir = os.path.join(root, name, "out")
+        if os.path.isfile(os.path.join(out_dir, MESSAGES_FILENAME)):
+            pages.append((name, out_dir, os.path.join(root, name, "assets")))
+    return pages
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-text search over extracted posts, hashtags and linked assets.")
+    parser.add_argument("--db", default=SEARCH_DB_FILENAME, help=f"Index database (default: ./{SEARCH_DB_FILENAME}).")
+    commands = parser.add_subparsers(dest="command", required=True)
+    update = commands.add_parser("update", help="Add or refresh pages from run_all output directories.")
+    update.add_argument("roots", nargs="+",
+                        help="A project directory (with out/ and assets/) or a --batch-out directory.")
+    query = commands.add_parser("query", help="Search the indexed posts.")
+    query.add_argument("text", nargs="?", default="", help="Words to find (all must match).")
+    query.add_argument("--tag", help="Only posts with this hashtag.")
+    query.add_argument("--page", help="Only posts from this page.")
+    query.add_argument("--limit", type=int, default=DEFAULT_RESULT_LIMIT)
+    query.add_argument("--raw", action="store_true", help="Treat the text as an FTS5 query (OR, NEAR, prefix*).")
+    query.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    index = SearchIndex(args.db)
+    try:
+        if args.command == "update":
+            for root in args.roots:
+                pages = find_page_dirs(root)
+                if not pages:
+                    print(f"Warning: no {MESSAGES_FILENAME} found under {root}", file=sys.stderr)
+                for name, out_dir, assets_dir in pages:
+                    counts = index.update_page(name, out_dir, assets_dir)
+                    print(f"{name}: {counts['posts_added']} posts added, {counts['asset_rows']} asset links")
+            print(f"Index {args.db}: {index.counts()}")
+        else:
+            started = time.perf_counter()
+            try:
+                results = index.search(args.text, args.limit, args.page, args.tag, args.raw)
+            except sqlite3.OperationalError as e:
+                print(f"Error: invalid query: {e}", file=sys.stderr)
+                sys.exit(1)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if args.json:
+                print(json.dumps(results, ensure_ascii=False, indent=2))
+            else:
+                for result in results:
+                    tags = " ".join(f"#{tag}" for tag in result["hashtags"])
+                    print(f"[{result['page']}] {result['post_id'] or '-'}  {result['snippet']}")
+                    if tags or result["assets"]:
+                        print(f"    {tags}  {' '.join(result['assets'])}".rstrip())
+                print(f"{len(results)} results in {elapsed_ms:.1f} ms", file=sys.stderr)
+    finally:
+        index.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+# Default location, inside the output directory
+STATE_DB_FILENAME = ".har_state.sqlite3"
+
+# HAR allows custom fields prefixed with "_"; the pipeline stores each entry's
+# response hash here so handlers can record their outputs against it
+CONTENT_HASH_FIELD = "_contentHash"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    content_hash TEXT PRIMARY KEY,
+    url TEXT,
+    entry_class TEXT,
+    har_path TEXT,
+    first_seen REAL
+);
+CREATE TABLE IF NOT EXISTS images (
+    content_hash TEXT PRIMARY KEY,
+    filename TEXT,
+    sha256 TEXT
+);
+CREATE TABLE IF NOT EXISTS messages (
+    content_hash TEXT,
+    ordinal INTEGER,
+    text TEXT,
+    record_json TEXT,
+    PRIMARY KEY (content_hash, ordinal)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def response_content_hash(entry):
+    """SHA256 over the response's mimeType, encoding and body, identifying the same response across captures."""
+    content = entry.get('response', {}).get('content', {})
+    digest = hashlib.sha256()
+    for part in (content.get('mimeType') or '', content.get('encoding') or '', content.get('text') or ''):
+        digest.update(part.encode('utf-8', errors='surrogatepass'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class EntryStateStore:
+    """
+    SQLite record of HAR entries that have already been processed, keyed by
+    response content hash, with the images and messages each one produced.
+    Changes are written in one transaction per run (see commit()).
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path)
+        self._conn.executescript(_SCHEMA)
+        self.is_new = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 0
+
+    def has_entry(self, content_hash):
+        return self._conn.execute(
+            "SELECT 1 FROM entries WHERE content_hash = ?", (content_hash,)).fetchone() is not None
+
+    def record_entry(self, content_hash, url, entry_class, har_path):
+        self._conn.execute(
+            "INSERT OR IGNORE INTO entries (content_hash, url, entry_class, har_path, first_seen) VALUES (?, ?, ?, ?, ?)",
+            (content_hash, url, entry_class, har_path, time.time()))
+
+    def record_image(self, content_hash, filename, sha256):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO images (content_hash, filename, sha256) VALUES (?, ?, ?)",
+            (content_hash, filename, sha256))
+
+    def record_messages(self, content_hash, records):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO messages (content_hash, ordinal, text, record_json) VALUES (?, ?, ?, ?)",
+            [(content_hash, ordinal, record["text"], json.dumps(record, ensure_ascii=False))
+             for ordinal, record in enumerate(records)])
+
+    def get_meta(self, key, default=None):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def counts(self):
+        return {
+            table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("entries", "images", "messages")
+        }
+
+    def commit(self):
+        self._conn.commit()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
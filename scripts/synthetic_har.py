@@ -0,0 +1,146 @@
+import argparse
+import base64
+import json
+import os
+import random
+import struct
+import zlib
+
+# Entry mix of a Facebook page capture, besides the images: GraphQL feed
+# batches carrying the posts, static JS/CSS bundles, and bodiless requests
+DEFAULT_IMAGE_RATIO = 0.4
+DEFAULT_GRAPHQL_RATIO = 0.2
+DEFAULT_STATIC_RATIO = 0.2
+DEFAULT_IMAGE_SIZE = (64, 256)  # Min and max side in pixels
+DEFAULT_DUPLICATE_RATE = 0.25
+DEFAULT_MESSAGES_PER_BODY = 5
+DEFAULT_STATIC_BODY_KB = 32
+
+_WORDS = ("bin", "delivered", "litre", "garbage", "rubbish", "recycle", "order", "waterfront", "school", "hotel",
+          "restaurant", "council", "kotakinabalu", "sabah", "promotion", "new", "stock", "colours", "wheel", "lid")
+_HASHTAGS = ("#rubbishbin", "#garbagebin", "#tongsampah", "#kotakinabalu", "#sabah", "#垃圾桶", "#亚庇")
+
+def _png_chunk(chunk_type, data):
+    return (struct.pack(">I", len(data)) + chunk_type + data
+            + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xffffffff))
+
+def make_png(width, height, rng):
+    """
+    Returns the bytes of a valid RGB PNG: a random-colour diagonal gradient with
+    low-order noise, so every image differs and compresses like a photo would.
+    """
+    base = [rng.randrange(256) for _ in range(3)]
+    step = [rng.randrange(1, 8) for _ in range(3)]
+    # Pixel (x, y) takes colour x + y of the gradient, so each row is a slice of it
+    gradient = bytes((base[channel] + step[channel] * t) & 0xf0
+                     for t in range(width + height) for channel in range(3))
+    row_length = width * 3
+    rows = []
+    for y in range(height):
+        row = int.from_bytes(gradient[y * 3:y * 3 + row_length], "big")
+        noise = int.from_bytes(rng.randbytes(row_length), "big") & int.from_bytes(b"\x0f" * row_length, "big")
+        rows.append(b"\x00" + (row | noise).to_bytes(row_length, "big"))  # Filter type 0 per scanline
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", header)
+            + _png_chunk(b"IDAT", zlib.compress(b"".join(rows), 6)) + _png_chunk(b"IEND", b""))
+
+def _post_text(rng, post_number):
+    words = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(4, 20)))
+    return f"Post {post_number}: {words.capitalize()} {' '.join(rng.sample(_HASHTAGS, 3))}"
+
+def _graphql_body(rng, first_post_number, message_count):
+    """An NDJSON GraphQL batch with one Story per line, as compact JSON like Facebook sends."""
+    lines = []
+    for offset in range(message_count):
+        post_number = first_post_number + offset
+        story = {
+            "__typename": "Story",
+            "post_id": str(100000000 + post_number),
+            "creation_time": 1700000000 + post_number * 3600,
+            "message": {"text": _post_text(rng, post_number)},
+            "attachments": [{"media": {"image": {"uri": f"https://scontent.example/p{post_number}.jpg"}}}],
+        }
+        lines.append(json.dumps({"data": {"node": story}}, ensure_ascii=False, separators=(',', ':')))
+    return "for (;;);" + "\n".join(lines)
+
+def _entry(url, mime_type, text=None, encoding=None):
+    content = {"size": len(text or ""), "mimeType": mime_type}
+    if text is not None:
+        content["text"] = text
+    if encoding:
+        content["encoding"] = encoding
+    return {
+        "startedDateTime": "2025-01-01T00:00:00.000Z",
+        "request": {"method": "GET", "url": url, "headers": []},
+        "response": {"status": 200, "headers": [], "content": content},
+    }
+
+def write_synthetic_har(path, entry_count=1000, image_ratio=DEFAULT_IMAGE_RATIO, graphql_ratio=DEFAULT_GRAPHQL_RATIO,
+                        static_ratio=DEFAULT_STATIC_RATIO, image_size=DEFAULT_IMAGE_SIZE,
+                        duplicate_rate=DEFAULT_DUPLICATE_RATE, messages_per_body=DEFAULT_MESSAGES_PER_BODY,
+                        static_body_kb=DEFAULT_STATIC_BODY_KB, seed=0):
+    """
+    Writes a Facebook-like HAR with entry_count entries and returns what it
+    contains: {"entries", "images", "unique_images", "graphql_bodies", "messages", "bytes"}.
+
+    image_ratio, graphql_ratio and static_ratio set the share of each entry
+    kind; the rest are bodiless requests. With probability duplicate_rate an
+    image entry repeats an earlier image byte for byte. The same seed always
+    gives the same file.
+    """
+    rng = random.Random(seed)
+    static_body = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz;(){} \n") for _ in range(static_body_kb * 1024))
+    images = []  # base64 bodies of distinct images, for duplicates to pick from
+    stats = {"entries": entry_count, "images": 0, "unique_images": 0, "graphql_bodies": 0, "messages": 0}
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"log": {"version": "1.2", "creator": {"name": "synthetic_har", "version": "1.0"}, "entries": [\n')
+        for index in range(entry_count):
+            roll = rng.random()
+            if roll < image_ratio:
+                stats["images"] += 1
+                if images and rng.random() < duplicate_rate:
+                    body = rng.choice(images)
+                else:
+                    width, height = (rng.randint(*image_size) for _ in range(2))
+                    body = base64.b64encode(make_png(width, height, rng)).decode('ascii')
+                    images.append(body)
+                    stats["unique_images"] += 1
+                entry = _entry(f"https://scontent.example/v/t39/{index}.png", "image/png", body, "base64")
+            elif roll < image_ratio + graphql_ratio:
+                entry = _entry("https://www.facebook.com/api/graphql/", "application/json",
+                               _graphql_body(rng, stats["messages"], messages_per_body))
+                stats["graphql_bodies"] += 1
+                stats["messages"] += messages_per_body
+            elif roll < image_ratio + graphql_ratio + static_ratio:
+                entry = _entry(f"https://static.xx.fbcdn.net/rsrc.php/v3/{index}.js", "application/javascript", static_body)
+            else:
+                entry = _entry(f"https://www.facebook.com/ajax/bz?i={index}", "text/plain")
+            if index:
+                f.write(',\n')
+            json.dump(entry, f, ensure_ascii=False)
+        f.write('\n]}}\n')
+    stats["bytes"] = os.path.getsize(path)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic Facebook-like HAR file for benchmarks and testing.")
+    parser.add_argument("output", help="Path of the HAR file to write.")
+    parser.add_argument("--entries", type=int, default=1000)
+    parser.add_argument("--image-ratio", type=float, default=DEFAULT_IMAGE_RATIO)
+    parser.add_argument("--graphql-ratio", type=float, default=DEFAULT_GRAPHQL_RATIO)
+    parser.add_argument("--static-ratio", type=float, default=DEFAULT_STATIC_RATIO)
+    parser.add_argument("--image-size", type=int, nargs=2, default=DEFAULT_IMAGE_SIZE, metavar=("MIN_PX", "MAX_PX"))
+    parser.add_argument("--duplicate-rate", type=float, default=DEFAULT_DUPLICATE_RATE)
+    parser.add_argument("--messages-per-body", type=int, default=DEFAULT_MESSAGES_PER_BODY)
+    parser.add_argument("--static-body-kb", type=int, default=DEFAULT_STATIC_BODY_KB)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    stats = write_synthetic_har(args.output, args.entries, args.image_ratio, args.graphql_ratio, args.static_ratio,
+                                tuple(args.image_size), args.duplicate_rate, args.messages_per_body,
+                                args.static_body_kb, args.seed)
+    print(json.dumps(stats))
+
+if __name__ == "__main__":
+    main()
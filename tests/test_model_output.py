@@ -0,0 +1,35 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from model_clients import STUB_PROFILE_XML
+from model_output import FenceStripper, strip_code_fences
+
+RESPONSES = [
+    STUB_PROFILE_XML,
+    'Here is the <CompanyProfile> XML:\n```xml\n<CompanyProfile/>\n```\nHope this helps',
+    'Sure:\n<CompanyProfile>\n</CompanyProfile>',
+    '```xml\n<CompanyProfile>cut off',
+    'no document at all',
+]
+
+def stream(text, chunk_size):
+    stripper = FenceStripper()
+    parts = [stripper.feed(text[start:start + chunk_size]) for start in range(0, len(text), chunk_size)]
+    return "".join(parts) + stripper.finish()
+
+class FenceStripperTest(unittest.TestCase):
+
+    def test_tag_in_preamble_does_not_end_it(self):
+        text = 'Here is the <CompanyProfile> XML:\n```xml\n<CompanyProfile/>\n```\nHope this helps'
+        self.assertEqual(strip_code_fences(text), '<CompanyProfile/>\n')
+
+    def test_streamed_output_matches_whole_response(self):
+        for text in RESPONSES:
+            for chunk_size in range(1, len(text) + 1):
+                self.assertEqual(stream(text, chunk_size), strip_code_fences(text), (text, chunk_size))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import re
+import sys
+import threading
+import time
+import unittest
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from model_clients import StubModelClient
+from profile_prompt import PROFILE_SECTIONS
+from profile_sections import PROFILE_ROOT_TAG, SectionGenerationError, SectionGenerator
+
+SECTION_NAMES = [name for name, _ in PROFILE_SECTIONS]
+_REQUESTED_SECTION = re.compile(r"Return only the <(\w+)> element")
+
+class SectionModel:
+    """
+    Per-section stub responses: answers each section prompt with a small
+    element, tracking how many requests are in flight. `failures` maps a
+    section name to the number of attempts that fail before it succeeds.
+    """
+
+    def __init__(self, failures=None, delay=0.02):
+        self.failures = dict(failures or {})
+        self.delay = delay
+        self.attempts = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt):
+        name = _REQUESTED_SECTION.search(prompt).group(1)
+        with self._lock:
+            self.attempts[name] = self.attempts.get(name, 0) + 1
+            attempt = self.attempts[name]
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            # Later sections finish first, so the merge order cannot come from completion order
+            time.sleep(self.delay * (len(SECTION_NAMES) - SECTION_NAMES.index(name)) / len(SECTION_NAMES))
+            if attempt <= self.failures.get(name, 0):
+                raise RuntimeError(f"stub failure {attempt} for {name}")
+            return f"```xml\n<{name}><Value>{name} text</Value></{name}>\n```"
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+def make_generator(model, concurrency=2, retries=2):
+    return SectionGenerator(StubModelClient(response_text=model), concurrency=concurrency, retries=retries,
+                            backoff_seconds=0)
+
+class SectionGeneratorTest(unittest.TestCase):
+
+    def test_requests_in_flight_stay_within_concurrency(self):
+        model = SectionModel()
+        make_generator(model, concurrency=2).generate("context")
+        self.assertEqual(model.max_in_flight, 2)
+        self.assertEqual(model.attempts, {name: 1 for name in SECTION_NAMES})
+
+    def test_failed_section_is_retried(self):
+        model = SectionModel(failures={"BrandIdentity": 1})
+        xml_text = make_generator(model).generate("context")
+        self.assertEqual(model.attempts["BrandIdentity"], 2)
+        self.assertIn("BrandIdentity text", xml_text)
+
+    def test_permanent_failure_raises(self):
+        model = SectionModel(failures={"TargetAudience": 10})
+        with self.assertRaises(SectionGenerationError):
+            make_generator(model, retries=2).generate("context")
+        self.assertEqual(model.attempts["TargetAudience"], 3)
+
+    def test_merged_profile_parses_in_section_order(self):
+        xml_text = make_generator(SectionModel(), concurrency=len(SECTION_NAMES)).generate("context")
+        root = ET.fromstring(xml_text.split("?>", 1)[1])
+        self.assertEqual(root.tag, PROFILE_ROOT_TAG)
+        self.assertEqual([element.tag for element in root], SECTION_NAMES)
+
+if __name__ == "__main__":
+    unittest.main()